@@ -0,0 +1,288 @@
+"""AQI threshold alerting over watched locations.
+
+Subscriptions are grouped by location, so each location is fetched once per interval no
+matter how many (location, threshold) subscriptions it has. A heap orders locations by
+their next due time, and each location keeps its thresholds sorted, so a reading only
+touches the thresholds it actually crossed.
+
+Each subscription carries its subscriber's fetch context (e.g. an API key). A location's
+checks rotate through the contexts of its current subscribers, so shared polling is paid
+for by everyone watching it, and a key stops being used once its subscriptions are gone.
+
+Subscriptions may name an owner (e.g. a dashboard session) that calls touch() while it is
+alive. With owner_ttl set, each cycle first drops every subscription of an owner whose last
+heartbeat is older than that, so closed sessions stop being polled (and using their keys).
+"""
+import bisect
+import concurrent.futures
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+import requests
+
+
+Subscription = namedtuple("Subscription", "sub_id location threshold sink context owner", defaults=(None,))
+
+logger = logging.getLogger("air13x.alerts")
+
+
+# -----------------------------------------------------------------------------
+# Sinks
+# -----------------------------------------------------------------------------
+class LogSink:
+    """Writes each alert to the `air13x.alerts` logger."""
+
+    def send(self, alerts):
+        for alert in alerts:
+            logger.warning("AQI alert: %s %s (%s) at AQI %s - threshold %s", alert["location"], alert["direction"], alert["category"], alert["aqi"], alert["threshold"])
+
+
+class FileSink:
+    """Appends alerts as JSON lines to a local file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, alerts):
+        with self._lock, open(self.path, "a", encoding="utf-8") as handle:
+            for alert in alerts: handle.write(json.dumps(alert, default=str) + "\n")
+
+
+class WebhookSink:
+    """POSTs a batch of alerts as JSON to a webhook URL (e.g. a local stand-in receiver)."""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, alerts):
+        try: requests.post(self.url, json={"alerts": alerts}, timeout=self.timeout).raise_for_status()
+        except requests.exceptions.RequestException as err: logger.error("Webhook delivery to %s failed - %s", self.url, err)
+
+
+class MemorySink:
+    """Keeps the most recent alerts in memory (used by the dashboard and the benchmark)."""
+
+    def __init__(self, maxlen=200):
+        self.alerts = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def send(self, alerts):
+        with self._lock: self.alerts.extend(alerts)
+
+    def snapshot(self):
+        """A copy of the kept alerts, safe to iterate while the engine thread adds more."""
+        with self._lock: return list(self.alerts)
+
+
+# -----------------------------------------------------------------------------
+# Engine
+# -----------------------------------------------------------------------------
+class _LocationGroup:
+    __slots__ = ("thresholds", "subs", "last_aqi", "interval", "seq", "checks")
+
+    def __init__(self, interval):
+        self.thresholds = [] # Sorted, parallel to subs
+        self.subs = []
+        self.last_aqi = None
+        self.interval = interval
+        self.seq = None # Heap entry currently scheduling this group
+        self.checks = 0
+
+    def next_context(self):
+        """The context for the next check, taken in turn from the subscribers that gave one."""
+        contexts = list(dict.fromkeys(sub.context for sub in self.subs if sub.context is not None))
+        self.checks += 1
+        return contexts[self.checks % len(contexts)] if contexts else None
+
+
+class AlertEngine:
+    """Evaluates threshold crossings for subscribed locations on a heap-driven schedule.
+
+    fetch(location, context) -> (aqi, error) is called once per due location per cycle.
+    lookup is an aqi_engine.CategoryLookup used to name the category of each alert.
+    """
+
+    def __init__(self, fetch, lookup, sinks=None, interval=900, max_workers=8, notify_on_first=True, owner_ttl=None):
+        self.fetch = fetch
+        self.lookup = lookup
+        self.sinks = sinks if sinks is not None else {"log": LogSink()}
+        self.interval = interval
+        self.max_workers = max_workers
+        self.notify_on_first = notify_on_first
+        self.owner_ttl = owner_ttl
+        self.recent = MemorySink()
+        self.stats = {"cycles": 0, "locations_fetched": 0, "alerts": 0, "fetch_errors": 0, "expired_subscriptions": 0, "last_cycle_ms": 0.0}
+        self._groups = {}
+        self._sub_locations = {}
+        self._owners = {} # owner -> last heartbeat (time.time())
+        self._pending = [] # Alerts raised outside a cycle (see subscribe), delivered by the next one
+        self._heap = [] # (next_due, seq, location)
+        self._seq = itertools.count()
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # --- Subscriptions ---
+    def subscribe(self, location, threshold, sink="log", context=None, interval=None, owner=None):
+        """Adds a (location, threshold) subscription and returns its id. New locations are due immediately.
+
+        `context` is passed to fetch() for this location's checks (in turn with other subscribers' contexts).
+        `owner` ties the subscription to a heartbeat (see touch() and owner_ttl). With notify_on_first, a location
+        that already has a reading above `threshold` gives the new subscription the same "entered" alert its
+        first subscriber got; it is delivered by the engine thread, not the caller.
+        """
+        if sink not in self.sinks: raise ValueError(f"Unknown alert sink '{sink}'.")
+        with self._lock:
+            group = self._groups.get(location)
+            if group is None:
+                group = self._groups[location] = _LocationGroup(interval or self.interval)
+                group.seq = next(self._seq)
+                heapq.heappush(self._heap, (time.time(), group.seq, location))
+                self._wake.set()
+            sub = Subscription(next(self._ids), location, threshold, sink, context, owner)
+            if owner is not None: self._owners[owner] = time.time()
+            idx = bisect.bisect_right(group.thresholds, threshold)
+            group.thresholds.insert(idx, threshold); group.subs.insert(idx, sub)
+            self._sub_locations[sub.sub_id] = location
+            if self.notify_on_first and group.last_aqi is not None and threshold <= group.last_aqi:
+                self._pending.append(self._alert(sub, "entered", str(self.lookup.category(group.last_aqi)[0]), group.last_aqi, None, time.time())); self._wake.set()
+            return sub.sub_id
+
+    def unsubscribe(self, sub_id):
+        with self._lock:
+            location = self._sub_locations.pop(sub_id, None)
+            group = self._groups.get(location)
+            if group is None: return False
+            idx = next(i for i, sub in enumerate(group.subs) if sub.sub_id == sub_id)
+            del group.thresholds[idx]; del group.subs[idx]
+            if not group.subs: del self._groups[location] # Its heap entry is skipped lazily
+            return True
+
+    def subscriptions(self, location=None, owner=None):
+        with self._lock:
+            if location is not None:
+                group = self._groups.get(location)
+                subs = list(group.subs) if group else []
+            else: subs = [sub for group in self._groups.values() for sub in group.subs]
+        return subs if owner is None else [sub for sub in subs if sub.owner == owner]
+
+    # --- Owners ---
+    def touch(self, owner, now=None):
+        """Heartbeat: keeps the owner's subscriptions alive for another owner_ttl seconds."""
+        with self._lock:
+            if owner in self._owners: self._owners[owner] = now or time.time()
+
+    def unsubscribe_owner(self, owner):
+        """Removes every subscription of `owner` and returns how many there were."""
+        with self._lock:
+            self._owners.pop(owner, None)
+            subs = [sub.sub_id for group in self._groups.values() for sub in group.subs if sub.owner == owner]
+            for sub_id in subs: self.unsubscribe(sub_id)
+            return len(subs)
+
+    def expire_owners(self, now=None):
+        """Drops the subscriptions of owners without a heartbeat for owner_ttl seconds. Returns the number removed."""
+        if self.owner_ttl is None: return 0
+        cutoff = (now or time.time()) - self.owner_ttl
+        with self._lock:
+            removed = sum(self.unsubscribe_owner(owner) for owner, seen in list(self._owners.items()) if seen < cutoff)
+        self.stats["expired_subscriptions"] += removed
+        return removed
+
+    def __len__(self):
+        with self._lock: return sum(len(group.subs) for group in self._groups.values())
+
+    # --- Evaluation ---
+    def evaluate(self, location, aqi, now=None):
+        """Applies one AQI reading to a location and returns the alerts for every threshold it crossed."""
+        with self._lock:
+            group = self._groups.get(location)
+            if group is None or aqi is None: return []
+            previous = group.last_aqi; group.last_aqi = aqi
+            if previous is None:
+                if not self.notify_on_first: return []
+                crossed, direction = group.subs[:bisect.bisect_right(group.thresholds, aqi)], "entered"
+            elif aqi > previous: # Rising: thresholds in (previous, aqi]
+                crossed, direction = group.subs[bisect.bisect_right(group.thresholds, previous):bisect.bisect_right(group.thresholds, aqi)], "entered"
+            elif aqi < previous: # Falling: thresholds in (aqi, previous]
+                crossed, direction = group.subs[bisect.bisect_right(group.thresholds, aqi):bisect.bisect_right(group.thresholds, previous)], "left"
+            else: return []
+        timestamp = now or time.time()
+        label = str(self.lookup.category(aqi)[0])
+        return [self._alert(sub, direction, label, aqi, previous, timestamp) for sub in crossed]
+
+    @staticmethod
+    def _alert(sub, direction, label, aqi, previous, timestamp):
+        return {"subscription_id": sub.sub_id, "location": sub.location, "threshold": sub.threshold, "direction": direction, "category": label,
+                "aqi": aqi, "previous_aqi": previous, "sink": sub.sink, "timestamp": timestamp}
+
+    def due_locations(self, now):
+        """Pops every location whose next check is due and reschedules it one interval later."""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, seq, location = heapq.heappop(self._heap)
+                group = self._groups.get(location)
+                if group is None or group.seq != seq: continue # Unsubscribed (or re-subscribed with a newer entry)
+                due.append((location, group.next_context()))
+                group.seq = next(self._seq)
+                heapq.heappush(self._heap, (now + group.interval, group.seq, location))
+        return due
+
+    def run_due(self, now=None):
+        """Runs one cycle: fetches each due location once, evaluates crossings and delivers alerts per sink."""
+        started = time.perf_counter(); now = now or time.time()
+        self.expire_owners(now)
+        due = self.due_locations(now)
+        with self._lock: alerts = [alert for alert in self._pending if alert["subscription_id"] in self._sub_locations]; self._pending = []
+        if due:
+            workers = min(self.max_workers, len(due))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                future_to_location = {executor.submit(self.fetch, location, context): location for location, context in due}
+                for future in concurrent.futures.as_completed(future_to_location):
+                    location = future_to_location[future]
+                    try: aqi, error = future.result()
+                    except Exception as exc: aqi, error = None, str(exc)
+                    if error or aqi is None: self.stats["fetch_errors"] += 1; continue
+                    alerts.extend(self.evaluate(location, aqi, now))
+        self.deliver(alerts)
+        self.stats["cycles"] += 1; self.stats["locations_fetched"] += len(due); self.stats["alerts"] += len(alerts)
+        self.stats["last_cycle_ms"] = (time.perf_counter() - started) * 1000
+        return alerts
+
+    def deliver(self, alerts):
+        if not alerts: return
+        self.recent.send(alerts)
+        by_sink = {}
+        for alert in alerts: by_sink.setdefault(alert["sink"], []).append(alert)
+        for sink_name, batch in by_sink.items():
+            try: self.sinks[sink_name].send(batch)
+            except Exception as exc: logger.error("Alert sink '%s' failed - %s", sink_name, exc)
+
+    # --- Background scheduling ---
+    def next_due(self):
+        with self._lock: return self._heap[0][0] if self._heap else None
+
+    def start(self):
+        """Runs cycles in a daemon thread, sleeping until the earliest due location."""
+        if self._thread and self._thread.is_alive(): return
+        self._thread = threading.Thread(target=self._loop, name="air13x-alerts", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            next_due = self.next_due()
+            wait = self.interval if next_due is None else max(0.0, next_due - time.time())
+            if wait > 0 and not self._pending:
+                self._wake.wait(wait); self._wake.clear()
+                continue
+            try: self.run_due()
+            except Exception as exc: logger.error("Alert cycle failed - %s", exc)
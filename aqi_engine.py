@@ -0,0 +1,124 @@
+"""Local US-EPA AQI engine: computes AQI from raw pollutant concentrations.
+
+Breakpoints follow the EPA Technical Assistance Document (2024 PM2.5 revision).
+Every function accepts scalars or array-likes and works on whole NumPy arrays,
+so a history series or tens of thousands of stations are handled in one pass.
+"""
+import numpy as np
+
+
+# -----------------------------------------------------------------------------
+# EPA Breakpoint Tables
+# -----------------------------------------------------------------------------
+# (C_lo, C_hi, I_lo, I_hi) per pollutant, concentrations in EPA_UNITS.
+# O3 uses the 8-hour table up to 300 and the 1-hour table for Hazardous.
+EPA_BREAKPOINTS = {
+    "pm2_5": ((0.0, 9.0, 0, 50), (9.1, 35.4, 51, 100), (35.5, 55.4, 101, 150), (55.5, 125.4, 151, 200), (125.5, 225.4, 201, 300), (225.5, 325.4, 301, 500)),
+    "pm10": ((0, 54, 0, 50), (55, 154, 51, 100), (155, 254, 101, 150), (255, 354, 151, 200), (355, 424, 201, 300), (425, 604, 301, 500)),
+    "o3": ((0, 54, 0, 50), (55, 70, 51, 100), (71, 85, 101, 150), (86, 105, 151, 200), (106, 200, 201, 300), (405, 604, 301, 500)),
+    "no2": ((0, 53, 0, 50), (54, 100, 51, 100), (101, 360, 101, 150), (361, 649, 151, 200), (650, 1249, 201, 300), (1250, 2049, 301, 500)),
+    "so2": ((0, 35, 0, 50), (36, 75, 51, 100), (76, 185, 101, 150), (186, 304, 151, 200), (305, 604, 201, 300), (605, 1004, 301, 500)),
+    "co": ((0.0, 4.4, 0, 50), (4.5, 9.4, 51, 100), (9.5, 12.4, 101, 150), (12.5, 15.4, 151, 200), (15.5, 30.4, 201, 300), (30.5, 50.4, 301, 500)),
+}
+EPA_UNITS = {"pm2_5": "µg/m³", "pm10": "µg/m³", "o3": "ppb", "no2": "ppb", "so2": "ppb", "co": "ppm"}
+EPA_TRUNCATION = {"pm2_5": 0.1, "pm10": 1, "o3": 1, "no2": 1, "so2": 1, "co": 0.1} # Concentrations are truncated before lookup
+AQI_POLLUTANTS = tuple(EPA_BREAKPOINTS)
+
+# Gas conversion µg/m³ -> ppb at 25 °C and 1 atm (molar volume 24.45 L/mol)
+MOLAR_VOLUME = 24.45
+MOLECULAR_WEIGHTS = {"o3": 48.00, "no2": 46.01, "so2": 64.07, "co": 28.01}
+
+# Breakpoints as column arrays, built once at import
+_TABLES = {
+    pollutant: tuple(np.array(column, dtype=float) for column in zip(*rows))
+    for pollutant, rows in EPA_BREAKPOINTS.items()
+}
+
+
+def ugm3_to_epa_units(pollutant, concentration):
+    """Converts a µg/m³ concentration (as reported by OWM) to the EPA unit for that pollutant."""
+    values = np.asarray(concentration, dtype=float)
+    if pollutant not in MOLECULAR_WEIGHTS: return values # Particulates are already in µg/m³
+    ppb = values * MOLAR_VOLUME / MOLECULAR_WEIGHTS[pollutant]
+    return ppb / 1000.0 if EPA_UNITS[pollutant] == "ppm" else ppb
+
+
+def pollutant_aqi(pollutant, concentration, ugm3=False):
+    """Sub-index AQI for one pollutant. Missing/negative concentrations give NaN; values above the table cap at 500."""
+    if pollutant not in _TABLES: raise ValueError(f"No EPA breakpoints for pollutant '{pollutant}'.")
+    c_lo, c_hi, i_lo, i_hi = _TABLES[pollutant]
+    values = ugm3_to_epa_units(pollutant, concentration) if ugm3 else np.asarray(concentration, dtype=float)
+    step = EPA_TRUNCATION[pollutant]
+    values = np.floor(values / step + 1e-9) * step
+
+    segment = np.clip(np.searchsorted(c_lo, values, side="right") - 1, 0, len(c_lo) - 1)
+    lo, hi, ilo, ihi = c_lo[segment], c_hi[segment], i_lo[segment], i_hi[segment]
+    aqi = (ihi - ilo) / (hi - lo) * (np.minimum(values, hi) - lo) + ilo
+    aqi = np.where(values > c_hi[-1], 500.0, aqi)
+    aqi = np.where(np.isfinite(values) & (values >= 0), np.rint(aqi), np.nan)
+    return aqi if aqi.ndim else float(aqi)
+
+
+def composite_aqi(components, ugm3=False):
+    """Overall AQI (max sub-index) and dominant pollutant for a dict of pollutant -> concentrations.
+
+    Returns (aqi, dominant): float arrays with NaN where no pollutant is known, and an
+    object array of pollutant keys (None where unknown).
+    """
+    keys = [p for p in AQI_POLLUTANTS if p in components and components[p] is not None]
+    if not keys: return np.array([], dtype=float), np.array([], dtype=object)
+    sub_indices = np.vstack([np.atleast_1d(pollutant_aqi(p, components[p], ugm3=ugm3)) for p in keys])
+    known = np.isfinite(sub_indices).any(axis=0)
+    dominant_idx = np.argmax(np.where(np.isfinite(sub_indices), sub_indices, -1.0), axis=0)
+    aqi = np.where(known, sub_indices[dominant_idx, np.arange(sub_indices.shape[1])], np.nan)
+    dominant = np.where(known, np.array(keys, dtype=object)[dominant_idx], None)
+    return aqi, dominant
+
+
+def aqi_from_owm_components(component_dicts):
+    """Vectorized US AQI for a sequence of OWM `components` dicts (µg/m³). Returns (aqi, dominant) arrays."""
+    if not component_dicts: return np.array([], dtype=float), np.array([], dtype=object)
+    columns = {p: np.array([(c or {}).get(p) for c in component_dicts], dtype=float) for p in AQI_POLLUTANTS} # None -> NaN
+    return composite_aqi(columns, ugm3=True)
+
+
+# -----------------------------------------------------------------------------
+# Category Lookup
+# -----------------------------------------------------------------------------
+class CategoryLookup:
+    """Precomputed AQI -> category table built from an AQI_CATEGORIES-style dict.
+
+    Integer AQI 0..max is mapped to a category index once, so labelling any number of
+    values is a single array index instead of a scan over the category ranges.
+    """
+
+    def __init__(self, categories, unknown=("Unknown", "#808080")):
+        bounds = sorted(categories)
+        self.boundaries = [lower for lower, _ in bounds]
+        self.labels = np.array([categories[b]["label"] for b in bounds] + [unknown[0]], dtype=object)
+        self.colors = np.array([categories[b]["color"] for b in bounds] + [unknown[1]], dtype=object)
+        self.unknown_index = len(bounds)
+        self.max_aqi = bounds[-1][1]
+        self.table = np.full(self.max_aqi + 1, self.unknown_index, dtype=np.int16)
+        for idx, (lower, upper) in enumerate(bounds):
+            self.table[max(lower, 0):upper + 1] = idx
+
+    def index(self, aqi_values):
+        """Category index per value; values above the table map to the top category, invalid ones to unknown."""
+        values = np.asarray(aqi_values, dtype=float)
+        result = np.full(values.shape, self.unknown_index, dtype=np.int16)
+        valid = np.isfinite(values) & (values >= 0)
+        result[valid] = self.table[np.minimum(np.trunc(values[valid]).astype(np.int64), self.max_aqi)]
+        return result
+
+    def labels_for(self, aqi_values): return self.labels[self.index(aqi_values)]
+
+    def colors_for(self, aqi_values): return self.colors[self.index(aqi_values)]
+
+    def category(self, aqi):
+        """Scalar (label, color) lookup with the same coercion rules as the original get_aqi_category."""
+        if aqi is None: return self.labels[self.unknown_index], self.colors[self.unknown_index]
+        try: aqi = int(aqi)
+        except (ValueError, TypeError): return self.labels[self.unknown_index], self.colors[self.unknown_index]
+        idx = self.table[min(aqi, self.max_aqi)] if aqi >= 0 else self.unknown_index
+        return self.labels[idx], self.colors[idx]
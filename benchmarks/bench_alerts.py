@@ -0,0 +1,66 @@
+"""Benchmark: alert evaluation cost per cycle as watched locations and subscriptions grow.
+
+Run from the repository root:  python benchmarks/bench_alerts.py [--cycles 5]
+The fetch is an in-memory random walk, so the numbers isolate scheduling + evaluation cost.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alerts import AlertEngine, MemorySink # noqa: E402
+from app import AQI_CATEGORIES, AQI_LOOKUP # noqa: E402
+
+SIZES = [(100, 1_000), (1_000, 10_000), (10_000, 100_000)] # (locations, subscriptions)
+THRESHOLDS = sorted(lower for lower, _ in AQI_CATEGORIES if lower > 0)
+
+
+def build_engine(locations, subscriptions, seed=13):
+    rng = random.Random(seed)
+    readings = {f"city-{i}": rng.randint(0, 300) for i in range(locations)}
+
+    def fetch(location, context):
+        readings[location] = max(0, min(500, readings[location] + rng.randint(-40, 40)))
+        return readings[location], None
+
+    engine = AlertEngine(fetch, AQI_LOOKUP, sinks={"memory": MemorySink(maxlen=1000)}, interval=60, max_workers=1)
+    names = list(readings)
+    for i in range(subscriptions):
+        engine.subscribe(names[i % locations], rng.choice(THRESHOLDS) + rng.randint(0, 10), sink="memory")
+    return engine
+
+
+def bench(locations, subscriptions, cycles):
+    engine = build_engine(locations, subscriptions)
+    now = time.time() + 1
+    eval_ms = []; cycle_ms = []
+    for _ in range(cycles):
+        started = time.perf_counter()
+        due = engine.due_locations(now)
+        alerts = [alert for location, context in due for alert in engine.evaluate(location, engine.fetch(location, context)[0], now)]
+        engine.deliver(alerts)
+        eval_ms.append((time.perf_counter() - started) * 1000)
+        now += engine.interval
+        engine.run_due(now) # Full cycle incl. the fetch thread pool
+        cycle_ms.append(engine.stats["last_cycle_ms"])
+        now += engine.interval
+    best_eval = min(eval_ms)
+    return {"locations": locations, "subscriptions": subscriptions, "eval_ms": best_eval, "us_per_sub": best_eval * 1000 / subscriptions,
+            "cycle_ms": min(cycle_ms), "fetches_per_cycle": locations, "alerts": engine.stats["alerts"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=5)
+    args = parser.parse_args()
+    print(f"{'locations':>10} {'subs':>8} {'fetches/cycle':>14} {'eval ms':>9} {'µs/sub':>8} {'cycle ms':>9} {'alerts':>8}")
+    for locations, subscriptions in SIZES:
+        r = bench(locations, subscriptions, args.cycles)
+        print(f"{r['locations']:>10} {r['subscriptions']:>8} {r['fetches_per_cycle']:>14} {r['eval_ms']:>9.2f} {r['us_per_sub']:>8.3f} {r['cycle_ms']:>9.2f} {r['alerts']:>8}")
+
+
+if __name__ == "__main__":
+    main()
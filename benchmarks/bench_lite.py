@@ -0,0 +1,87 @@
+"""Benchmark: chart payload and estimated time-to-interactive of the dashboard, full vs lite mode.
+
+Run from the repository root:  python benchmarks/bench_lite.py [--kbps 1600] [--rtt-ms 150] [--stations 2000] [--history-days 30]
+Builds the dashboard's charts from synthetic data the way each mode sends them (Plotly figure
+JSON, or palette PNGs of downsampled data) and records the bytes and build time of each.
+Time-to-interactive on a throttled link is estimated as build time + transfer of the payload,
+plus the Plotly.js chunk and one round trip for it whenever a Plotly figure is on the page.
+The voice widget's external script is not counted (lite mode loads it only on request).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import matplotlib.pyplot as plt
+import plotly.io as pio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app # noqa: E402
+from bench_scaling import CENTRE, parsed_stations, pollutant_history # noqa: E402
+
+
+def scale_bar(dpi, colors):
+    fig = app.create_aqi_scale_bar(157)
+    try: return app.figure_png(fig, dpi=dpi, colors=colors)
+    finally: plt.close(fig)
+
+
+def charts(mode, stations, nearby, cities, history):
+    """name -> zero-argument builder of what the panel sends in `mode`."""
+    surface = lambda: app.create_aqi_surface(stations, *app.map_bounds(*CENTRE))
+    if mode == "full":
+        return {"aqi scale": lambda: scale_bar(200, None),
+                "history": lambda: app.create_history_line_chart(history),
+                "nearby": lambda: app.create_nearby_bar_chart(nearby),
+                "ranking": lambda: app.create_ranking_bar_chart(cities),
+                "map": lambda: app.create_world_map(stations, "token", *CENTRE, surface=surface())}
+    return {"aqi scale": lambda: scale_bar(app.LITE_DPI, app.LITE_COLORS),
+            "history": lambda: app.create_history_png(history),
+            "nearby": lambda: app.create_bar_png(nearby, 'Top {count} Nearby Stations (US AQI)'),
+            "ranking": lambda: app.create_bar_png(cities, 'Top {count} Polluted Cities (from monitored list)')}
+
+
+def measure(build):
+    """(bytes sent, ms to build and serialise, is a Plotly figure)."""
+    started = time.perf_counter(); chart = build()
+    payload = chart if isinstance(chart, bytes) else pio.to_json(chart, validate=False).encode()
+    return len(payload), (time.perf_counter() - started) * 1000, not isinstance(chart, bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--kbps", type=float, default=app.REFERENCE_LINK_KBPS, help="Throttled downlink in kbit/s")
+    parser.add_argument("--rtt-ms", type=float, default=150)
+    parser.add_argument("--stations", type=int, default=2000, help="Map stations")
+    parser.add_argument("--history-days", type=int, default=30)
+    args = parser.parse_args()
+    rng = random.Random(13)
+    stations = [dict(s, lat=CENTRE[0] + rng.uniform(-10, 10), lon=CENTRE[1] + rng.uniform(-10, 10)) for s in parsed_stations(args.stations, rng)]
+    nearby = parsed_stations(10, rng); cities = [{**city, "stations": 3} for city in parsed_stations(200, rng)]
+    history = pollutant_history(args.history_days * 24, rng)
+
+    totals = {}
+    print(f"{'mode':<6} {'chart':<10} {'KiB':>8} {'build ms':>9}")
+    for mode in ("full", "lite"):
+        builders = charts(mode, stations, nearby, cities, history)
+        for build in builders.values(): build() # Warm-up (imports, plotly validators)
+        size = build_ms = 0; plotly = False
+        for name, build in builders.items():
+            chart_bytes, ms, is_figure = measure(build)
+            size += chart_bytes; build_ms += ms; plotly |= is_figure
+            print(f"{mode:<6} {name:<10} {chart_bytes / 1024:>8.1f} {ms:>9.1f}")
+        bundle = app.PLOTLY_BUNDLE_BYTES if plotly else 0
+        tti = build_ms / 1000 + app.transfer_seconds(size + bundle, args.kbps) + (args.rtt_ms / 1000 if plotly else 0)
+        totals[mode] = (size, bundle, tti)
+
+    print(f"\nEstimated time-to-interactive at {args.kbps / 1000:.1f} Mbit/s, {args.rtt_ms:.0f} ms RTT:")
+    for mode, (size, bundle, tti) in totals.items():
+        print(f"  {mode}: {(size + bundle) / 1024:,.0f} KiB ({size / 1024:,.0f} KiB charts + {bundle / 1024:,.0f} KiB Plotly.js) -> {tti:.2f} s")
+    full, lite = totals["full"], totals["lite"]
+    print(f"  lite mode sends {1 - (lite[0] + lite[1]) / (full[0] + full[1]):.0%} fewer bytes and is interactive {full[2] - lite[2]:.2f} s ({1 - lite[2] / full[2]:.0%}) sooner")
+
+
+if __name__ == "__main__":
+    main()
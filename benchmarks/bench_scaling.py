@@ -0,0 +1,194 @@
+"""Benchmark: how the pure data-shaping and figure-building functions scale with input size.
+
+Run from the repository root:  python benchmarks/bench_scaling.py [--sizes 10,100,1000,10000,100000] [--only create_world_map]
+Each case gets synthetic stations / forecast entries / history hours at every size and records
+the best time and the peak traced memory of one call. Provider calls are answered in memory,
+so only parsing, filtering, aggregation and figure construction are measured.
+
+The scaling exponent is the slope of log(time) over log(size) from FIT_FROM items up (fixed
+per-call overhead dominates below that). `--save` stores the results as the baseline; later
+runs compare against it and exit with status 1 when a case turned super-linear, i.e. its
+exponent exceeds LINEAR_LIMIT and the baseline exponent by more than EXPONENT_TOLERANCE.
+Exponents, unlike absolute times, are comparable between machines.
+"""
+import argparse
+import contextlib
+import datetime
+import gc
+import inspect
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app # noqa: E402
+from history import HISTORY_POLLUTANTS, PollutantHistory # noqa: E402
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+FIT_FROM = 1_000
+LINEAR_LIMIT = 1.3 # Single-shot timings at 100k items put linear cases anywhere in n^0.9..1.15
+EXPONENT_TOLERANCE = 0.25
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "bench_scaling.json")
+CENTRE = (23.8, 90.4) # Dhaka, the app's default map centre
+EPOCH = 1_700_000_000
+
+
+# -----------------------------------------------------------------------------
+# Synthetic Inputs
+# -----------------------------------------------------------------------------
+def waqi_stations(n, rng):
+    """Raw WAQI /map/bounds/ entries around CENTRE, a few with '-' or missing AQI like the real feed."""
+    return [{"uid": i, "lat": CENTRE[0] + rng.uniform(-1.5, 1.5), "lon": CENTRE[1] + rng.uniform(-1.5, 1.5),
+             "aqi": "-" if i % 17 == 0 else str(rng.randint(0, 400)), "station": {"name": f"Station {i} - Synthetic Road, District {i % 97}", "url": f"synthetic/{i}"}}
+            for i in range(n)]
+
+
+def parsed_stations(n, rng):
+    return [{"uid": i, "name": f"Station {i} - Synthetic Road, District {i % 97}", "aqi": rng.randint(0, 400), "lat": rng.uniform(-60, 70), "lon": rng.uniform(-180, 180)} for i in range(n)]
+
+
+def weather_forecast_entries(n, rng):
+    return [{"dt": EPOCH + 3 * 3600 * i, "main": {"temp": rng.uniform(10, 40)}, "weather": [{"description": rng.choice(("clear sky", "haze", "light rain")), "icon": rng.choice(("01d", "50d", "10n"))}]} for i in range(n)]
+
+
+def aqi_forecast_entries(n, rng):
+    return [{"dt": EPOCH + 3600 * i, "main": {"aqi": rng.randint(1, 5)}, "components": {key: rng.uniform(0, 150) for key in HISTORY_POLLUTANTS}} for i in range(n)]
+
+
+def pollutant_history(n, rng):
+    values = np.random.default_rng(rng.randint(0, 2**32)).uniform(0, 150, (len(HISTORY_POLLUTANTS), n))
+    return PollutantHistory(EPOCH + 3600 * np.arange(n), dict(zip(HISTORY_POLLUTANTS, values)))
+
+
+@contextlib.contextmanager
+def provider_answers(payload):
+    """Answers app.http_get with `payload` in memory for the duration of the block."""
+    response = SimpleNamespace(status_code=200, json=lambda: payload, raise_for_status=lambda: None)
+    original = app.http_get; app.http_get = lambda *args, **kwargs: response
+    try: yield
+    finally: app.http_get = original
+
+
+def raw(func):
+    """The undecorated fetch (no fallback, coordinate snapping or caches in the way)."""
+    return inspect.unwrap(func)
+
+
+def fetch_case(func, build_payload, *args):
+    def setup(n, rng):
+        payload = build_payload(n, rng)
+        def call():
+            with provider_answers(payload): data, error = raw(func)(*args)
+            if error: raise RuntimeError(error)
+        return call
+    return setup
+
+
+# name -> setup(n, rng) returning a zero-argument call
+CASES = {
+    "get_aqi_category": lambda n, rng: (lambda values: lambda: [app.get_aqi_category(value) for value in values])([rng.randint(-10, 600) for _ in range(n)]),
+    "weather forecast aggregation": fetch_case(app.get_owm_5day_weather_forecast, lambda n, rng: {"list": weather_forecast_entries(n, rng)}, "key", *CENTRE),
+    "AQI forecast aggregation": fetch_case(app.get_owm_aqi_forecast, lambda n, rng: {"list": aqi_forecast_entries(n, rng)}, "key", *CENTRE),
+    "get_waqi_nearby_stations filter": fetch_case(app.get_waqi_nearby_stations, lambda n, rng: {"status": "ok", "data": waqi_stations(n, rng)}, "key", *CENTRE),
+    "get_waqi_map_stations parse": fetch_case(app.get_waqi_map_stations, lambda n, rng: {"status": "ok", "data": waqi_stations(n, rng)}, "key"),
+    "create_nearby_bar_chart": lambda n, rng: (lambda stations: lambda: app.create_nearby_bar_chart(stations))(parsed_stations(n, rng)),
+    "create_ranking_bar_chart": lambda n, rng: (lambda cities: lambda: app.create_ranking_bar_chart(cities))([{**city, "stations": 3} for city in parsed_stations(n, rng)]),
+    "create_world_map": lambda n, rng: (lambda stations: lambda: app.create_world_map(stations, "token"))(parsed_stations(n, rng)),
+    "create_history_line_chart": lambda n, rng: (lambda history: lambda: app.create_history_line_chart(history))(pollutant_history(n, rng)),
+}
+
+
+# -----------------------------------------------------------------------------
+# Measurement
+# -----------------------------------------------------------------------------
+def repeats_for(n):
+    return 7 if n <= 1_000 else (3 if n <= 10_000 else 1)
+
+
+def measure(call, repeats):
+    """(best ms, peak traced KiB) of a call; memory is traced in a separate run so it does not skew the timing."""
+    call() # Warm-up (imports, plotly validators)
+    times = []; gc.collect(); gc.disable() # As timeit does: collector pauses are noise here
+    try:
+        for _ in range(repeats):
+            started = time.perf_counter(); call(); times.append((time.perf_counter() - started) * 1000)
+    finally: gc.enable()
+    tracemalloc.start()
+    try: call(); peak = tracemalloc.get_traced_memory()[1]
+    finally: tracemalloc.stop()
+    return min(times), peak / 1024
+
+
+def exponent(sizes, values):
+    """Least-squares slope of log(value) over log(size) for sizes >= FIT_FROM, or None with fewer than two points."""
+    points = [(n, v) for n, v in zip(sizes, values) if n >= FIT_FROM and v > 0]
+    if len(points) < 2: return None
+    return round(float(np.polyfit(np.log([n for n, _ in points]), np.log([v for _, v in points]), 1)[0]), 3)
+
+
+def run_case(name, sizes, seed=13):
+    ms, peak_kib = [], []
+    for n in sizes:
+        call = CASES[name](n, random.Random(seed))
+        best, peak = measure(call, repeats_for(n)); ms.append(round(best, 3)); peak_kib.append(round(peak, 1))
+    return {"sizes": sizes, "ms": ms, "peak_kib": peak_kib, "time_exponent": exponent(sizes, ms), "memory_exponent": exponent(sizes, peak_kib)}
+
+
+def regressions(name, result, baseline):
+    """Messages for each exponent that turned super-linear against the baseline."""
+    found = []
+    for metric in ("time_exponent", "memory_exponent"):
+        current = result[metric]; before = (baseline or {}).get(metric)
+        if current is None or before is None: continue
+        if current > LINEAR_LIMIT and current > before + EXPONENT_TOLERANCE:
+            found.append(f"{name}: {metric.split('_')[0]} now scales as n^{current:.2f} (baseline n^{before:.2f})")
+    return found
+
+
+def _fmt_exponent(value): return "   -" if value is None else f"{value:4.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="Comma-separated input sizes")
+    parser.add_argument("--only", action="append", choices=list(CASES), help="Run only this case (repeatable)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="Store this run as the baseline")
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as handle: baseline = json.load(handle).get("cases", {})
+
+    results = {}; found = []
+    print(f"{'case':<32} {'n':>8} {'best ms':>10} {'µs/item':>9} {'peak KiB':>10}")
+    for name in args.only or CASES:
+        result = results[name] = run_case(name, sizes)
+        for n, ms, kib in zip(sizes, result["ms"], result["peak_kib"]):
+            print(f"{name:<32} {n:>8} {ms:>10.2f} {ms * 1000 / n:>9.2f} {kib:>10.1f}")
+        before = baseline.get(name, {})
+        print(f"{'':<32} time ~ n^{_fmt_exponent(result['time_exponent'])} (baseline {_fmt_exponent(before.get('time_exponent'))}), "
+              f"memory ~ n^{_fmt_exponent(result['memory_exponent'])} (baseline {_fmt_exponent(before.get('memory_exponent'))})")
+        found += regressions(name, result, before)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        stored = {"recorded": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"), "python": platform.python_version(),
+                  "machine": platform.machine(), "cases": {**baseline, **results}}
+        with open(args.baseline, "w", encoding="utf-8") as handle: json.dump(stored, handle, indent=1)
+        print(f"Baseline saved to {args.baseline}")
+    if found:
+        print("\nSuper-linear regressions:"); print("\n".join(f"  {message}" for message in found))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
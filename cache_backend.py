@@ -0,0 +1,292 @@
+"""Pluggable shared cache for fetch results, so several app replicas can share warm data.
+
+Backends store compact bytes with a TTL:
+    LRUBackend     in-process, bounded (the default; one per replica)
+    SQLiteBackend  a local SQLite file shared by every process on the host
+    RedisBackend   any Redis-protocol server, spoken directly over a socket (no client library)
+
+The backend is chosen with AIR13X_CACHE: "lru", "sqlite:///cache.db" (four slashes for an
+absolute path) or "redis://host:6379/0". For development and tests,
+`python cache_backend.py --serve 6380` runs a small in-memory Redis-protocol stand-in.
+
+Values are pickled (protocol 5) and zlib-compressed when larger than COMPRESS_ABOVE bytes.
+Only trusted replicas should share a backend: cached values are unpickled on read.
+"""
+import argparse
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+
+COMPRESS_ABOVE = 1024
+KEY_PREFIX = "air13x:v2:" # Bump the version when cached value shapes change
+
+logger = logging.getLogger("air13x.cache")
+
+
+# -----------------------------------------------------------------------------
+# Serialization
+# -----------------------------------------------------------------------------
+def dumps(value):
+    raw = pickle.dumps(value, protocol=5)
+    if len(raw) > COMPRESS_ABOVE: return b"Z" + zlib.compress(raw, 6)
+    return b"P" + raw
+
+
+def loads(blob):
+    return pickle.loads(zlib.decompress(blob[1:]) if blob[:1] == b"Z" else blob[1:])
+
+
+# -----------------------------------------------------------------------------
+# Backends
+# -----------------------------------------------------------------------------
+class LRUBackend:
+    name = "lru"
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # key -> (expires_at, blob)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: return None
+            if entry[0] <= time.time(): del self._entries[key]; return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, blob, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, blob); self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock: self._entries.pop(key, None)
+
+
+class SQLiteBackend:
+    """One table in a local SQLite file (WAL mode), with one connection per thread."""
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None) # Autocommit
+            conn.execute("PRAGMA journal_mode=WAL"); conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None: return None
+        if row[1] <= time.time(): self.delete(key); return None
+        return row[0]
+
+    def set(self, key, blob, ttl):
+        self._conn().execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)", (key, blob, time.time() + ttl))
+
+    def delete(self, key): self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def purge_expired(self): return self._conn().execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+class RedisBackend:
+    """Minimal RESP client (GET / SET PX / DEL) with one socket per thread."""
+    name = "redis"
+
+    def __init__(self, host="localhost", port=6379, db=0, timeout=1.0):
+        self.host, self.port, self.db, self.timeout = host, port, db, timeout
+        self._local = threading.local()
+
+    def _command(self, *parts):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+            if self.db: self._send(conn, "SELECT", str(self.db))
+        try: return self._send(conn, *parts)
+        except OSError:
+            self._local.conn = None; conn[0].close()
+            raise
+
+    @staticmethod
+    def _send(conn, *parts):
+        sock, reader = conn
+        payload = [b"*%d\r\n" % len(parts)]
+        for part in parts:
+            data = part if isinstance(part, bytes) else str(part).encode()
+            payload.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        sock.sendall(b"".join(payload))
+        return _read_reply(reader)
+
+    def get(self, key): return self._command("GET", key)
+
+    def set(self, key, blob, ttl): self._command("SET", key, blob, "PX", str(max(1, int(ttl * 1000))))
+
+    def delete(self, key): self._command("DEL", key)
+
+
+def _read_reply(reader):
+    line = reader.readline()
+    if not line: raise ConnectionError("Redis connection closed")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+": return body.decode()
+    if kind == b"-": raise RuntimeError(body.decode())
+    if kind == b":": return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0: return None
+        data = reader.read(length + 2)
+        return data[:-2]
+    if kind == b"*": return [_read_reply(reader) for _ in range(int(body))]
+    raise ConnectionError(f"Unexpected Redis reply {line!r}")
+
+
+def backend_from_url(url):
+    """Backend for an AIR13X_CACHE value: 'lru', 'sqlite:///cache.db' or 'redis://host:port/db'."""
+    if not url or url == "lru": return LRUBackend()
+    parts = urlsplit(url)
+    if parts.scheme == "sqlite": return SQLiteBackend(parts.path[1:]) # sqlite:///relative.db, sqlite:////absolute.db
+    if parts.scheme == "redis": return RedisBackend(parts.hostname or "localhost", parts.port or 6379, int(parts.path.strip("/") or 0))
+    raise ValueError(f"Unknown cache backend '{url}'.")
+
+
+# -----------------------------------------------------------------------------
+# Shared Cache
+# -----------------------------------------------------------------------------
+class SharedCache:
+    """Object cache over a backend. Backend failures are logged and treated as misses, never raised."""
+
+    retry_after = 30.0 # Seconds to bypass a failing backend before trying it again
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = {"hits": 0, "misses": 0, "errors": 0, "bytes_written": 0}
+        self._down_until = 0.0
+
+    def get(self, key):
+        if time.monotonic() < self._down_until: self.stats["misses"] += 1; return None
+        try: blob = self.backend.get(KEY_PREFIX + key)
+        except Exception as exc: self._error("get", exc); return None
+        if blob is None: self.stats["misses"] += 1; return None
+        try: value = loads(blob)
+        except Exception as exc: # Truncated or corrupt entry: drop it and refetch
+            self.stats["errors"] += 1; self.stats["misses"] += 1
+            logger.warning("Shared cache entry %s on %s backend is unreadable, dropping it - %s", key, self.backend.name, exc)
+            try: self.backend.delete(KEY_PREFIX + key)
+            except Exception as delete_exc: self._error("delete", delete_exc)
+            return None
+        self.stats["hits"] += 1
+        return value
+
+    def set(self, key, value, ttl):
+        if time.monotonic() < self._down_until: return
+        blob = dumps(value)
+        try: self.backend.set(KEY_PREFIX + key, blob, ttl)
+        except Exception as exc: self._error("set", exc); return
+        self.stats["bytes_written"] += len(blob)
+
+    def _error(self, operation, exc):
+        self.stats["errors"] += 1; self._down_until = time.monotonic() + self.retry_after
+        if self.stats["errors"] == 1 or self.stats["errors"] % 100 == 0: logger.warning("Shared cache %s failed on %s backend - %s", operation, self.backend.name, exc)
+
+
+def call_key(func, args, kwargs):
+    digest = hashlib.blake2b(pickle.dumps((args, sorted(kwargs.items())), protocol=5), digest_size=16).hexdigest()
+    return f"{func.__module__}.{func.__qualname__}:{digest}"
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """The process-wide SharedCache for the backend configured in AIR13X_CACHE."""
+    global _cache
+    with _cache_lock:
+        if _cache is None: _cache = SharedCache(backend_from_url(os.environ.get("AIR13X_CACHE", "lru")))
+        return _cache
+
+
+def shared_cache(ttl):
+    """Caches a fetch returning (data, error) in the shared cache. Only successful results are stored."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = get_shared_cache(); key = call_key(func, args, kwargs)
+            hit = cache.get(key)
+            if hit is not None: return hit, None
+            data, error = func(*args, **kwargs)
+            if error is None and data is not None: cache.set(key, data, ttl)
+            return data, error
+        return wrapper
+    return decorator
+
+
+# -----------------------------------------------------------------------------
+# Redis-Protocol Stand-In (development / tests)
+# -----------------------------------------------------------------------------
+class StandInRedisServer(socketserver.ThreadingTCPServer):
+    """In-memory server for the GET/SET [PX]/DEL/PING/SELECT/FLUSHDB subset RedisBackend uses."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        self.store = {}; self.lock = threading.Lock()
+        super().__init__(address, _StandInHandler)
+
+
+class _StandInHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try: command = _read_reply(self.rfile)
+            except (ConnectionError, OSError): return
+            self.wfile.write(self._execute([part.decode() if i == 0 else part for i, part in enumerate(command)]))
+
+    def _execute(self, command):
+        name, args = command[0].upper(), command[1:]
+        store, lock = self.server.store, self.server.lock
+        with lock:
+            if name == "PING": return b"+PONG\r\n"
+            if name in ("SELECT", "FLUSHDB"):
+                if name == "FLUSHDB": store.clear()
+                return b"+OK\r\n"
+            if name == "SET":
+                expires = time.time() + int(args[3]) / 1000 if len(args) >= 4 and args[2].upper() == b"PX" else None
+                store[args[0]] = (args[1], expires)
+                return b"+OK\r\n"
+            if name == "GET":
+                value, expires = store.get(args[0], (None, None))
+                if value is None or (expires is not None and expires <= time.time()): store.pop(args[0], None); return b"$-1\r\n"
+                return b"$%d\r\n%s\r\n" % (len(value), value)
+            if name == "DEL": return b":%d\r\n" % sum(store.pop(key, None) is not None for key in args)
+        return b"-ERR unknown command\r\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Redis-protocol stand-in used for local shared-cache testing.")
+    parser.add_argument("--serve", type=int, default=6380, metavar="PORT")
+    parser.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args(argv)
+    with StandInRedisServer((args.host, args.serve)) as server:
+        print(f"Redis-protocol stand-in on {args.host}:{args.serve} (AIR13X_CACHE=redis://{args.host}:{args.serve}/0)")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
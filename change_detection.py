@@ -0,0 +1,109 @@
+"""Content-hash change detection for provider responses and the data derived from them.
+
+WAQI stations and IQAir readings change about hourly, but refetches happen more often.
+Three layers stop unchanged data from being reprocessed:
+
+    HTTP      ETag / Last-Modified validators are stored per request and sent back as
+              If-None-Match / If-Modified-Since; a 304 is answered with the stored body.
+    Parsing   every response body is fingerprinted (BLAKE2b); parse_json() returns the
+              previous result for a byte-identical body instead of decoding it again.
+    Rendering content_hash() fingerprints parsed datasets, so figures are rebuilt only
+              when a dataset's content changed (see app._mark_fetched).
+
+STATS counts how often each layer skipped work.
+"""
+import hashlib
+import io
+import pickle
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+
+VALIDATOR_ENTRIES = 512 # Requests whose validators (and, for validated ones, bodies) are kept
+PARSED_ENTRIES = 256 # Parsed results kept by (parser, body fingerprint)
+
+STATS = {"responses": 0, "not_modified": 0, "unchanged_bodies": 0, "parses_skipped": 0, "figures_skipped": 0, "snapshot_writes_skipped": 0}
+
+
+def fingerprint(payload):
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def content_hash(value):
+    """Fingerprint of any picklable, non-recursive value (datasets, PollutantHistory, ...)."""
+    buffer = io.BytesIO(); pickler = pickle.Pickler(buffer, protocol=5)
+    pickler.fast = True # No memo, so equal values hash alike whichever of their objects happen to be shared
+    pickler.dump(value)
+    return fingerprint(buffer.getvalue())
+
+
+def request_key(url, params=None):
+    return f"{url}?{urlencode(sorted((params or {}).items()), doseq=True)}"
+
+
+class _LRU(OrderedDict):
+    def __init__(self, max_entries):
+        super().__init__(); self.max_entries = max_entries; self.lock = threading.Lock()
+
+    def remember(self, key, value):
+        with self.lock:
+            self[key] = value; self.move_to_end(key)
+            while len(self) > self.max_entries: self.popitem(last=False)
+
+    def recall(self, key):
+        with self.lock:
+            value = self.get(key)
+            if value is not None: self.move_to_end(key)
+            return value
+
+
+class ResponseValidators:
+    """Per request: (etag, last_modified, body or None, body fingerprint) of the last good response."""
+
+    def __init__(self, max_entries=VALIDATOR_ENTRIES):
+        self._entries = _LRU(max_entries)
+
+    def request_headers(self, key):
+        """Conditional headers for a request whose previous body is still held, else {}."""
+        entry = self._entries.recall(key)
+        if entry is None or entry[2] is None: return {}
+        etag, last_modified, _, _ = entry
+        return {name: value for name, value in (("If-None-Match", etag), ("If-Modified-Since", last_modified)) if value}
+
+    def observe(self, key, response):
+        """Sets response.fingerprint and response.unchanged; turns a 304 into the stored 200 response."""
+        entry = self._entries.recall(key); STATS["responses"] += 1
+        if response.status_code == 304 and entry is not None and entry[2] is not None:
+            response.status_code = 200; response._content = entry[2]
+            response.fingerprint = entry[3]; response.unchanged = True
+            STATS["not_modified"] += 1
+            return response
+        content = getattr(response, "content", None)
+        if response.status_code != 200 or not isinstance(content, bytes): return response
+        response.fingerprint = fingerprint(content)
+        response.unchanged = entry is not None and entry[3] == response.fingerprint
+        if response.unchanged: STATS["unchanged_bodies"] += 1
+        headers = getattr(response, "headers", None) or {}
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        self._entries.remember(key, (etag, last_modified, content if etag or last_modified else None, response.fingerprint)) # Bodies are only kept when a 304 can reuse them
+        return response
+
+
+VALIDATORS = ResponseValidators()
+_parsed = _LRU(PARSED_ENTRIES)
+
+
+def parse_json(response, parse, *args):
+    """parse(response.json(), *args), reusing the result of the last byte-identical body parsed by `parse` with the same args.
+
+    The reused result is shared, so callers must not modify it in place.
+    """
+    body = getattr(response, "fingerprint", None)
+    if body is None: return parse(response.json(), *args)
+    key = (parse.__module__, parse.__qualname__, body, args)
+    result = _parsed.recall(key)
+    if result is not None: STATS["parses_skipped"] += 1; return result[0]
+    result = parse(response.json(), *args)
+    _parsed.remember(key, (result,))
+    return result
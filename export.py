@@ -0,0 +1,159 @@
+"""Streaming export of history, station and ranking data to CSV or Parquet.
+
+Rows are produced by generators and written in fixed-size chunks, so memory stays
+bounded by one chunk (plus one location's history) however many rows are exported.
+Data comes from the dashboard's own fetch functions (and their caches), or from data
+that is already loaded in a session.
+
+Headless use:
+    python export.py "Dhaka,Dhaka,Bangladesh" "23.81,90.41" --datasets history map --format parquet --out exports
+"""
+import argparse
+import csv
+import datetime
+import io
+import itertools
+import os
+import sys
+import time
+
+from history import HISTORY_POLLUTANTS
+
+
+EXPORT_FORMATS = ("csv", "parquet")
+EXPORT_COLUMNS = {
+    "history": ("location", "timestamp", "aqi", "pm2_5", "pm10", "no2", "o3", "so2", "co", "nh3", "no"),
+    "nearby": ("location", "name", "aqi", "lat", "lon", "url"),
+    "ranking": ("name", "aqi", "stations"),
+    "map": ("location", "uid", "name", "aqi", "lat", "lon"),
+}
+EXPORT_DATASETS = tuple(EXPORT_COLUMNS)
+CHUNK_ROWS = 5000
+
+
+def chunked(rows, size=CHUNK_ROWS):
+    """Yields lists of at most `size` rows from any iterable."""
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk: return
+        yield chunk
+
+
+# -----------------------------------------------------------------------------
+# Writers
+# -----------------------------------------------------------------------------
+class CsvChunkWriter:
+    def __init__(self, target, columns):
+        self._handle = io.TextIOWrapper(target, encoding="utf-8", newline="", write_through=True)
+        self._writer = csv.DictWriter(self._handle, fieldnames=columns, extrasaction="ignore")
+        self._writer.writeheader()
+
+    def write(self, rows): self._writer.writerows(rows)
+
+    def close(self): self._handle.detach() # Leave the target open for the caller
+
+
+class ParquetChunkWriter:
+    """Writes each chunk as one Parquet row group."""
+
+    def __init__(self, target, columns):
+        try: import pyarrow as pa; import pyarrow.parquet as pq
+        except ImportError as exc: raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow).") from exc
+        self._pa = pa
+        types = {"timestamp": pa.timestamp("s", tz="UTC"), "aqi": pa.int64(), "lat": pa.float64(), "lon": pa.float64(), "uid": pa.int64(), "stations": pa.int64(), **{pollutant: pa.float64() for pollutant in HISTORY_POLLUTANTS}}
+        self._schema = pa.schema([(column, types.get(column, pa.string())) for column in columns])
+        self._writer = pq.ParquetWriter(target, self._schema)
+
+    def write(self, rows): self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self._schema))
+
+    def close(self): self._writer.close()
+
+
+def write_rows(rows, target, fmt, columns, chunk_rows=CHUNK_ROWS):
+    """Streams rows into a binary file object as CSV or Parquet. Returns the number of rows written."""
+    if fmt not in EXPORT_FORMATS: raise ValueError(f"Unknown export format '{fmt}'.")
+    writer = (CsvChunkWriter if fmt == "csv" else ParquetChunkWriter)(target, columns)
+    count = 0
+    try:
+        for chunk in chunked(rows, chunk_rows):
+            writer.write(chunk); count += len(chunk)
+    finally: writer.close()
+    return count
+
+
+def export_bytes(rows, fmt, columns, chunk_rows=CHUNK_ROWS):
+    """Export into memory (for st.download_button). Returns (data, row_count)."""
+    buffer = io.BytesIO()
+    count = write_rows(rows, buffer, fmt, columns, chunk_rows)
+    return buffer.getvalue(), count
+
+
+# -----------------------------------------------------------------------------
+# Row Sources
+# -----------------------------------------------------------------------------
+def session_rows(dataset, location, data):
+    """Rows for data already loaded in a dashboard session."""
+    for item in data or []:
+        yield dict(item, location=location) if dataset != "ranking" else item
+
+
+def fetch_rows(dataset, locations, api_keys, history_days=7):
+    """Rows for each (label, lat, lon) location using the dashboard's fetch functions. Errors are reported on stderr."""
+    import app # Deferred: importing the dashboard module pulls in Streamlit
+    if dataset == "ranking": # Every monitored city, from one worldwide station snapshot
+        stations, error = app.get_global_station_snapshot(api_keys["waqi"])
+        if error: print(error, file=sys.stderr)
+        yield from app.rank_cities_from_stations(stations)
+        return
+    for label, lat, lon in locations:
+        if dataset == "history": data, error = app.get_owm_history(api_keys["openweathermap"], lat, lon, days=history_days)
+        elif dataset == "nearby": data, error = app.get_waqi_nearby_stations(api_keys["waqi"], lat, lon)
+        else: data, error = app.get_waqi_map_stations_tiled(api_keys["waqi"], *app.map_bounds(lat, lon))
+        if error: print(f"{label}: {error}", file=sys.stderr)
+        yield from session_rows(dataset, label, data)
+
+
+def resolve_locations(specs, owm_api_key):
+    """Turns 'lat,lon' or 'city,state,country' strings into (label, lat, lon) tuples, geocoding names."""
+    import app
+    locations = []
+    for spec in specs:
+        parts = [part.strip() for part in spec.split(",")]
+        try: locations.append((spec, float(parts[0]), float(parts[1]))); continue
+        except (ValueError, IndexError): pass
+        city, state, country = (parts + ["", ""])[:3] if len(parts) != 2 else (parts[0], "", parts[1])
+        coords, error = app.get_coordinates(owm_api_key, city, state, country)
+        if error: print(f"{spec}: {error}", file=sys.stderr); continue
+        locations.append((spec, coords["lat"], coords["lon"]))
+    return locations
+
+
+# -----------------------------------------------------------------------------
+# Command Line
+# -----------------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export Air 13X history, station and ranking data to CSV or Parquet.")
+    parser.add_argument("locations", nargs="*", help="'lat,lon' or 'city,state,country' (ranking needs none)")
+    parser.add_argument("--datasets", nargs="+", choices=EXPORT_DATASETS, default=list(EXPORT_DATASETS))
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--days", type=int, default=7, help="History range in days")
+    parser.add_argument("--out", default="exports", help="Output directory")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    import app
+    api_keys = {name: os.environ.get(f"AIR13X_{name.upper()}_KEY", key) for name, key in app.DEFAULT_API_KEYS.items()}
+    locations = resolve_locations(args.locations, api_keys["openweathermap"])
+    os.makedirs(args.out, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    for dataset in args.datasets:
+        if dataset != "ranking" and not locations: print(f"{dataset}: skipped (no locations)", file=sys.stderr); continue
+        path = os.path.join(args.out, f"air13x-{dataset}-{stamp}.{args.format}")
+        started = time.perf_counter()
+        with open(path, "wb") as target: count = write_rows(fetch_rows(dataset, locations, api_keys, args.days), target, args.format, EXPORT_COLUMNS[dataset], args.chunk_rows)
+        print(f"{dataset}: {count} rows -> {path} ({time.perf_counter() - started:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Columnar hourly pollutant history, as returned by the OWM air pollution history API.
+
+Every component OWM reports (PM2.5, PM10, NO2, O3, SO2, CO, NH3, NO) is kept from one
+fetch, one NumPy column per pollutant plus the hourly US AQI, so any pollutant can be
+charted or exported without another round trip and a year of hours stays compact.
+"""
+import datetime
+
+import numpy as np
+
+from aqi_engine import composite_aqi
+
+
+# OWM component key -> (label, unit); concentrations are µg/m³
+HISTORY_POLLUTANTS = {
+    "pm2_5": ("PM2.5", "µg/m³"), "pm10": ("PM10", "µg/m³"), "no2": ("NO₂", "µg/m³"), "o3": ("O₃", "µg/m³"),
+    "so2": ("SO₂", "µg/m³"), "co": ("CO", "µg/m³"), "nh3": ("NH₃", "µg/m³"), "no": ("NO", "µg/m³"),
+}
+
+
+class PollutantHistory:
+    """Hourly series: `timestamps` (Unix seconds, ascending), one float column per pollutant (NaN = missing) and `aqi`."""
+
+    __slots__ = ("timestamps", "columns", "aqi")
+
+    def __init__(self, timestamps, columns, aqi=None):
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.columns = {key: np.asarray(columns.get(key, np.full(len(self.timestamps), np.nan)), dtype=float) for key in HISTORY_POLLUTANTS}
+        self.aqi = composite_aqi(self.columns, ugm3=True)[0] if aqi is None else np.asarray(aqi, dtype=float)
+        if not len(self.aqi): self.aqi = np.full(len(self.timestamps), np.nan)
+
+    @classmethod
+    def from_owm(cls, entries):
+        """From the `list` of an OWM air pollution response; US AQI is computed for every hour in one pass."""
+        entries = [entry for entry in entries if entry.get("dt") is not None]
+        components = [entry.get("components") or {} for entry in entries]
+        columns = {key: np.array([c.get(key) for c in components], dtype=float) for key in HISTORY_POLLUTANTS} # None -> NaN
+        return cls([entry["dt"] for entry in entries], columns)
+
+    @classmethod
+    def concat(cls, parts):
+        """One sorted series from several; on duplicate hours the first part wins."""
+        parts = [part for part in parts if part is not None and len(part)]
+        if not parts: return cls([], {})
+        timestamps = np.concatenate([part.timestamps for part in parts])
+        _, first = np.unique(timestamps, return_index=True) # Sorted unique hours
+        columns = {key: np.concatenate([part.columns[key] for part in parts])[first] for key in HISTORY_POLLUTANTS}
+        return cls(timestamps[first], columns, np.concatenate([part.aqi for part in parts])[first])
+
+    def since(self, cutoff):
+        """The hours at or after a Unix timestamp."""
+        keep = self.timestamps >= cutoff
+        return PollutantHistory(self.timestamps[keep], {key: column[keep] for key, column in self.columns.items()}, self.aqi[keep])
+
+    def available(self):
+        """Pollutants with at least one reading."""
+        return [key for key, column in self.columns.items() if np.isfinite(column).any()]
+
+    def datetimes(self):
+        return [datetime.datetime.fromtimestamp(ts, tz=datetime.timezone.utc) for ts in self.timestamps.tolist()]
+
+    def rows(self):
+        """One dict per hour (timestamp as a UTC datetime, NaN as None), e.g. for export."""
+        columns = {key: column.tolist() for key, column in self.columns.items()}; aqi = self.aqi.tolist()
+        for i, timestamp in enumerate(self.datetimes()):
+            row = {"timestamp": timestamp, "aqi": int(aqi[i]) if aqi[i] == aqi[i] else None}
+            row.update((key, values[i] if values[i] == values[i] else None) for key, values in columns.items())
+            yield row
+
+    __iter__ = rows
+
+    def __len__(self): return len(self.timestamps)
+
+    def __eq__(self, other):
+        if not isinstance(other, PollutantHistory): return NotImplemented
+        return (np.array_equal(self.timestamps, other.timestamps) and np.array_equal(self.aqi, other.aqi, equal_nan=True)
+                and all(np.array_equal(self.columns[key], other.columns[key], equal_nan=True) for key in HISTORY_POLLUTANTS))
+
+    __hash__ = None
+
+    def __getstate__(self): return self.timestamps, self.columns, self.aqi
+
+    def __setstate__(self, state): self.timestamps, self.columns, self.aqi = state
+
+    def __repr__(self): return f"PollutantHistory({len(self)} hours, {', '.join(self.available()) or 'no data'})"
@@ -0,0 +1,141 @@
+"""Speculative prefetch of a location's data while the user is still choosing it.
+
+A prefetch plan runs a location's fetches in stages (e.g. coordinates, current AQI and
+weather first, then forecasts and history, which need the coordinates) on background
+threads. The results land in the fetch functions' shared cache, so the later "View
+Data" click is served from it.
+
+Each session has at most one plan. Starting a plan for a new selection cancels the
+previous one: steps not yet started are skipped (a request already in flight still
+completes and is cached). Spend is bounded twice: each plan has a budget of upstream
+calls, and all plans together may spend at most PREFETCH_CALLS_PER_MINUTE. A step
+whose cost does not fit is skipped rather than started. Prefetch requests run in the
+scheduler's background class, so they never hold up what users are looking at.
+"""
+import concurrent.futures
+import threading
+import time
+from collections import OrderedDict, deque
+
+from resilience import in_context
+from scheduler import request_priority, request_session
+
+
+PLAN_BUDGET = 10 # Upstream calls one plan may spend
+PREFETCH_CALLS_PER_MINUTE = 120 # Across all sessions
+MAX_CONCURRENT_PLANS = 2
+STEP_WORKERS = 6
+MAX_TRACKED_SESSIONS = 256
+
+
+class PrefetchCancelled(Exception):
+    """Raised inside a plan when a newer selection superseded it."""
+
+
+class PrefetchRun:
+    """One plan for one selection: runs its steps in stages and records what happened to each."""
+
+    def __init__(self, prefetcher, key, budget):
+        self.prefetcher = prefetcher
+        self.key = key
+        self.budget = budget
+        self.spent = 0
+        self.steps = {} # name -> "queued" | "done" | "failed" | "skipped (budget)" | "cancelled"
+        self.started_at = time.time(); self.finished_at = None
+        self.used = False # The selection was viewed after this plan ran
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self): return self._cancelled.is_set()
+
+    def cancel(self): self._cancelled.set()
+
+    def stage(self, *steps):
+        """Runs (name, cost, func, *args[, kwargs dict]) steps concurrently and returns {name: data} of the ones that succeeded."""
+        if self.cancelled: raise PrefetchCancelled()
+        admitted = {}
+        for name, cost, func, *args in steps:
+            kwargs = args.pop() if args and isinstance(args[-1], dict) else {}
+            if self.spent + cost > self.budget or not self.prefetcher._spend(cost):
+                self.steps[name] = "skipped (budget)"; self.prefetcher.stats["over_budget"] += 1; continue
+            self.spent += cost; self.steps[name] = "queued"
+            admitted[name] = self.prefetcher._steps.submit(in_context(self._run_step), name, func, args, kwargs)
+        results = {}
+        for name, future in admitted.items():
+            data = future.result()
+            if data is not None: results[name] = data
+        return results
+
+    def _run_step(self, name, func, args, kwargs):
+        if self.cancelled: self.steps[name] = "cancelled"; return None
+        try:
+            with request_priority("background"): data, error = func(*args, **kwargs)
+        except Exception: data, error = None, "exception"
+        self.steps[name] = "failed" if error or data is None else "done"
+        self.prefetcher.stats["steps_done" if self.steps[name] == "done" else "steps_failed"] += 1
+        return None if error else data
+
+    def snapshot(self):
+        return {"key": self.key, "spent": self.spent, "budget": self.budget, "steps": dict(self.steps), "cancelled": self.cancelled,
+                "finished": self.finished_at is not None, "seconds": round((self.finished_at or time.time()) - self.started_at, 2)}
+
+
+class Prefetcher:
+    """Runs at most one prefetch plan per session, a few plans at a time process-wide."""
+
+    def __init__(self, plan_budget=PLAN_BUDGET, calls_per_minute=PREFETCH_CALLS_PER_MINUTE, max_plans=MAX_CONCURRENT_PLANS, step_workers=STEP_WORKERS):
+        self.plan_budget = plan_budget
+        self.calls_per_minute = calls_per_minute
+        self._plans = concurrent.futures.ThreadPoolExecutor(max_workers=max_plans, thread_name_prefix="air13x-prefetch")
+        self._steps = concurrent.futures.ThreadPoolExecutor(max_workers=step_workers, thread_name_prefix="air13x-prefetch-step")
+        self._runs = OrderedDict() # session -> PrefetchRun
+        self._spending = deque() # (time, cost) within the last minute
+        self._lock = threading.Lock()
+        self.stats = {"plans": 0, "cancelled": 0, "used": 0, "calls": 0, "steps_done": 0, "steps_failed": 0, "over_budget": 0}
+
+    def _spend(self, cost):
+        """Takes `cost` calls from the process-wide per-minute budget, or returns False if they do not fit."""
+        with self._lock:
+            now = time.monotonic()
+            while self._spending and now - self._spending[0][0] > 60: self._spending.popleft()
+            if sum(spent for _, spent in self._spending) + cost > self.calls_per_minute: return False
+            self._spending.append((now, cost)); self.stats["calls"] += cost
+            return True
+
+    def start(self, session, key, plan, *args):
+        """Starts plan(run, *args) for a selection key, cancelling the session's plan for any other key. No-op if already started for key."""
+        with self._lock:
+            current = self._runs.get(session)
+            if current is not None and current.key == key and not current.cancelled: return current
+            if current is not None and current.finished_at is None: current.cancel(); self.stats["cancelled"] += 1
+            run = self._runs[session] = PrefetchRun(self, key, self.plan_budget); self._runs.move_to_end(session)
+            while len(self._runs) > MAX_TRACKED_SESSIONS: self._runs.popitem(last=False)[1].cancel()
+            self.stats["plans"] += 1
+        self._plans.submit(self._execute, run, plan, args, session) # A fresh context: nothing of the triggering rerun leaks in
+        return run
+
+    def _execute(self, run, plan, args, session):
+        try:
+            with request_session(session):
+                if not run.cancelled: plan(run, *args)
+        except PrefetchCancelled: pass
+        finally: run.finished_at = time.time()
+
+    def cancel(self, session):
+        with self._lock:
+            run = self._runs.get(session)
+            if run is not None and run.finished_at is None and not run.cancelled: run.cancel(); self.stats["cancelled"] += 1
+
+    def claim(self, session, key):
+        """Marks the session's plan as used when the user views the selection it prefetched; returns the run or None."""
+        with self._lock:
+            run = self._runs.get(session)
+            if run is None or run.key != key or run.cancelled: return None
+            if not run.used: run.used = True; self.stats["used"] += 1
+            return run
+
+    def run_for(self, session):
+        with self._lock: return self._runs.get(session)
+
+
+PREFETCHER = Prefetcher()
@@ -0,0 +1,147 @@
+"""Opt-in profiling of single script runs: a sampling profiler plus a tracemalloc allocation diff.
+
+While a profiled block runs, a background thread samples the calling thread's stack every
+SAMPLE_INTERVAL seconds (wall clock, so time spent waiting on providers is included) and
+tracemalloc records the allocations made inside the block. Samples and allocations are
+attributed to named categories of functions (innermost matching frame wins), and both are
+exported as collapsed stacks ("root;...;leaf weight"), the input format of flamegraph.pl,
+inferno and speedscope.
+
+Sampling costs little. tracemalloc is process-wide and slows every thread several times
+over while tracing (more with deeper tracebacks), so it is optional, and only one block is
+profiled at a time; concurrent profile_run() calls simply run unprofiled.
+"""
+import collections
+import contextlib
+import inspect
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+
+SAMPLE_INTERVAL = 0.002 # Seconds between stack samples (the GIL switch interval makes ~5 ms typical under load)
+TRACE_FRAMES = 16 # Frames kept per allocation traceback; deeper tracebacks attribute better but cost far more
+TOP_ALLOCATIONS = 10
+OTHER = ("Other", "")
+
+_profile_lock = threading.Lock()
+
+
+def _code_of(func):
+    """The code object that actually runs for func, looking through bound methods and functools.wraps wrappers."""
+    func = inspect.unwrap(getattr(func, "__func__", func))
+    return getattr(func, "__func__", func).__code__
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Categories:
+    """Maps frames to (category, function) by code object (samples) or by file and line range (allocations)."""
+
+    def __init__(self, categories):
+        self.by_code = {}; self.ranges = collections.defaultdict(list); self._line_cache = {}
+        for category, functions in categories.items():
+            for func in functions:
+                code = _code_of(func)
+                self.by_code[code] = (category, code.co_name)
+                last = max((line for _, _, line in code.co_lines() if line is not None), default=code.co_firstlineno)
+                self.ranges[code.co_filename].append((code.co_firstlineno, last, category, code.co_name))
+
+    def for_stack(self, codes):
+        """Category of a leaf-first tuple of code objects."""
+        for code in codes:
+            match = self.by_code.get(code)
+            if match: return match
+        return OTHER
+
+    def for_line(self, filename, lineno):
+        key = (filename, lineno)
+        if key not in self._line_cache:
+            matches = [(last - first, category, name) for first, last, category, name in self.ranges.get(filename, ()) if first <= lineno <= last]
+            self._line_cache[key] = min(matches)[1:] if matches else None # Innermost (shortest) enclosing function
+        return self._line_cache[key]
+
+    def for_traceback(self, traceback):
+        for frame in reversed(traceback): # Most recent frame first
+            match = self.for_line(frame.filename, frame.lineno)
+            if match: return match
+        return OTHER
+
+
+class StackSampler(threading.Thread):
+    """Counts the leaf-first stacks of one thread, sampled every `interval` seconds until stop()."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name="air13x-profiler", daemon=True)
+        self.thread_id = thread_id; self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            codes = []
+            while frame is not None: codes.append(frame.f_code); frame = frame.f_back
+            if codes: self.stacks[tuple(codes)] += 1
+
+    def stop(self):
+        self._stop_event.set(); self.join()
+
+
+def _time_report(stacks, elapsed_ms, categories):
+    total = sum(stacks.values())
+    per_sample = elapsed_ms / total if total else 0.0
+    buckets = collections.Counter(); folded = collections.Counter()
+    for codes, count in stacks.items():
+        buckets[categories.for_stack(codes)] += count
+        folded[";".join(frame_label(code) for code in reversed(codes) if not code.co_filename.endswith("threading.py"))] += count
+    rows = {bucket: {"ms": count * per_sample, "share": count / total} for bucket, count in buckets.items()}
+    return rows, "\n".join(f"{stack} {count}" for stack, count in folded.most_common()), total
+
+
+def _memory_report(snapshot, categories):
+    snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)))
+    buckets = collections.Counter(); folded = collections.Counter()
+    for stat in snapshot.statistics("traceback"):
+        buckets[categories.for_traceback(stat.traceback)] += stat.size
+        folded[";".join(f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in stat.traceback)] += stat.size
+    top = [f"{stat.size / 1024:10.1f} KiB  {stat.count:7d} blocks  {stat.traceback[0].filename}:{stat.traceback[0].lineno}" for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]]
+    return buckets, "\n".join(f"{stack} {size}" for stack, size in folded.most_common()), top
+
+
+@contextlib.contextmanager
+def profile_run(categories, interval=SAMPLE_INTERVAL, trace_memory=True):
+    """Profiles the block on the calling thread. Yields a dict that is filled in on exit.
+
+    `categories` maps a category name to the functions attributed to it. The report has
+    elapsed_ms, samples, rows (category, function, ms, share, alloc_kib), time_folded,
+    memory_folded, peak_kib and top_allocations; it only has skipped=True when another
+    run was already being profiled.
+    """
+    report = {}
+    if not _profile_lock.acquire(blocking=False):
+        report["skipped"] = True; yield report; return
+    try:
+        tracing = trace_memory and not tracemalloc.is_tracing() # Leave tracing someone else started alone
+        if tracing: tracemalloc.start(TRACE_FRAMES)
+        sampler = StackSampler(threading.get_ident(), interval); sampler.start()
+        started = time.perf_counter()
+        try: yield report
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            sampler.stop()
+            snapshot = tracemalloc.take_snapshot() if tracing else None
+            peak = tracemalloc.get_traced_memory()[1] if tracing else 0
+            if tracing: tracemalloc.stop()
+            categories = Categories(categories)
+            time_rows, time_folded, samples = _time_report(sampler.stacks, elapsed_ms, categories)
+            memory, memory_folded, top = _memory_report(snapshot, categories) if snapshot else ({}, "", [])
+            rows = [{"category": bucket[0], "function": bucket[1], "ms": time_rows.get(bucket, {}).get("ms", 0.0), "share": time_rows.get(bucket, {}).get("share", 0.0), "alloc_kib": memory.get(bucket, 0) / 1024}
+                    for bucket in set(time_rows) | set(memory)]
+            report.update(elapsed_ms=elapsed_ms, samples=samples, rows=sorted(rows, key=lambda row: -row["ms"]), time_folded=time_folded,
+                          memory_folded=memory_folded, peak_kib=peak / 1024, top_allocations=top)
+    finally: _profile_lock.release()
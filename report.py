@@ -0,0 +1,200 @@
+"""Headless batch report: AQI, weather, forecast and health advice for many cities.
+
+Runs the dashboard's own fetch functions for every city with bounded parallelism.
+Identical requests (the same city twice, or cities that geocode to the same point)
+share one in-flight call. Cities without an IQAir reading get one batched AQI estimate
+from nearby WAQI stations.
+
+    python report.py "Dhaka,Dhaka,Bangladesh" "Delhi,Delhi,India" --out reports
+    python report.py --file cities.txt --workers 16 --format json html
+
+Each city is 'city,state,country', 'city,country' or 'lat,lon'; a --file has one per line.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import html
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+
+REPORT_FORMATS = ("json", "html")
+DEFAULT_WORKERS = 8
+
+
+# -----------------------------------------------------------------------------
+# Shared Call Cache
+# -----------------------------------------------------------------------------
+class SharedCalls:
+    """Memoizes calls for one run; concurrent callers of the same key wait for a single fetch."""
+
+    def __init__(self):
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.hits = 0; self.misses = 0
+
+    def call(self, func, *args):
+        key = (func.__name__,) + args
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                future = self._futures[key] = concurrent.futures.Future(); self.misses += 1; owner = True
+            else: self.hits += 1; owner = False
+        if owner:
+            try: future.set_result(func(*args))
+            except Exception as exc: future.set_result((None, f"{func.__name__}: unexpected error - {exc}"))
+        return future.result()
+
+
+class StageTimer:
+    """Thread-safe wall-clock totals per fetch stage."""
+
+    def __init__(self):
+        self.totals = {}; self.counts = {}
+        self._lock = threading.Lock()
+
+    def run(self, stage, func, *args):
+        started = time.perf_counter()
+        try: return func(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.totals[stage] = self.totals.get(stage, 0.0) + elapsed; self.counts[stage] = self.counts.get(stage, 0) + 1
+
+
+# -----------------------------------------------------------------------------
+# Per-City Report
+# -----------------------------------------------------------------------------
+def parse_city(spec):
+    """(city, state, country, lat, lon) from a city spec; lat/lon are None for names."""
+    parts = [part.strip() for part in spec.split(",")]
+    try: return "", "", "", float(parts[0]), float(parts[1])
+    except (ValueError, IndexError): pass
+    if len(parts) == 2: return parts[0], "", parts[1], None, None
+    city, state, country = (parts + ["", ""])[:3]
+    return city, state, country, None, None
+
+
+def city_report(app, spec, api_keys, calls, timer):
+    """Fetches everything for one city. AQI estimates for cities without IQAir data are filled in later in one batch."""
+    started = time.perf_counter()
+    city, state, country, lat, lon = parse_city(spec)
+    report = {"city": spec, "errors": []}
+    if lat is None:
+        coords, error = timer.run("geocode", calls.call, app.get_coordinates, api_keys["openweathermap"], city, state, country)
+        if error: report["errors"].append(error)
+        else: lat, lon = coords["lat"], coords["lon"]
+    report["lat"], report["lon"] = lat, lon
+
+    if city:
+        report["aqi"], error = timer.run("aqi", calls.call, app.get_iqair_aqi, api_keys["iqair"], city, state, country)
+        if error: report["iqair_error"] = error
+        report["weather"], error = timer.run("weather", calls.call, app.get_openweathermap_weather, api_keys["openweathermap"], city, state, country)
+        if error: report["errors"].append(error)
+    else: report["aqi"], report["weather"] = None, None
+
+    if lat is not None:
+        key = (round(lat, 4), round(lon, 4)) # Geocoding the same place twice gives identical coordinates
+        weather_fc, weather_error = timer.run("forecast", calls.call, app.get_owm_5day_weather_forecast, api_keys["openweathermap"], *key)
+        aqi_fc, aqi_error = timer.run("forecast", calls.call, app.get_owm_aqi_forecast, api_keys["openweathermap"], *key)
+        report["errors"].extend(error for error in (weather_error, aqi_error) if error)
+        report["forecast"] = [dict(day, date=day["date"].isoformat(), **(aqi_fc or {}).get(day["date"], {})) for day in weather_fc or []]
+    report["seconds"] = time.perf_counter() - started
+    return report
+
+
+def fill_estimates(app, reports, api_keys, timer):
+    """One batched nearby-station estimate for every city without an IQAir AQI."""
+    missing = [r for r in reports if not r.get("aqi") and r.get("lat") is not None]
+    if not missing: return
+    estimates, error = timer.run("estimate", app.estimate_aqi_points, api_keys["waqi"], [(r["lat"], r["lon"]) for r in missing])
+    for report, estimate in zip(missing, estimates or [None] * len(missing)):
+        if estimate: report["aqi"] = dict(estimate, estimated=True)
+        else: report["errors"].append(report.pop("iqair_error", None) or error or "No AQI available.")
+
+
+def add_health(app, report):
+    aqi = (report.get("aqi") or {}).get("aqi_us")
+    label, color = app.get_aqi_category(aqi)
+    report["category"], report["color"] = str(label), str(color)
+    report["health"] = app.HEALTH_RECOMMENDATIONS.get(report["category"], app.HEALTH_RECOMMENDATIONS["Unknown"])
+    report.pop("iqair_error", None)
+
+
+# -----------------------------------------------------------------------------
+# Output
+# -----------------------------------------------------------------------------
+def write_json(reports, path):
+    with open(path, "w", encoding="utf-8") as handle: json.dump(reports, handle, indent=2, default=str)
+
+
+def write_html(reports, path, generated):
+    rows = []
+    for r in reports:
+        aqi = r.get("aqi") or {}; weather = r.get("weather") or {}
+        aqi_text = f"{aqi.get('aqi_us')}" + (" (est.)" if aqi.get("estimated") else "") if aqi.get("aqi_us") is not None else "N/A"
+        forecast = ", ".join(f"{d['date'][5:]}: {d.get('us_aqi', 'N/A')}" for d in r.get("forecast", [])[:5])
+        rows.append(f"<tr><td>{html.escape(r['city'])}</td><td style='background:{r['color']};color:#000'><b>{aqi_text}</b></td><td>{html.escape(r['category'])}</td>"
+                    f"<td>{html.escape(r['health']['short'])}</td><td>{weather.get('temperature', 'N/A')} °C, {html.escape(str(weather.get('description', 'N/A')))}</td>"
+                    f"<td>{html.escape(forecast) or 'N/A'}</td><td>{html.escape('; '.join(r['errors']))}</td></tr>")
+    page = f"""<!DOCTYPE html><html><head><meta charset="utf-8"><title>Air 13X Report {generated}</title>
+<style>body{{font-family:sans-serif;background:#030412;color:#fff}}table{{border-collapse:collapse;width:100%}}td,th{{border:1px solid #333;padding:6px;font-size:13px;vertical-align:top}}th{{background:#21263F}}</style></head>
+<body><h1>Air 13X Air Quality Report</h1><p>Generated {generated} · {len(reports)} cities</p>
+<table><tr><th>City</th><th>US AQI</th><th>Category</th><th>Health</th><th>Weather</th><th>Max US AQI forecast</th><th>Errors</th></tr>{''.join(rows)}</table></body></html>"""
+    with open(path, "w", encoding="utf-8") as handle: handle.write(page)
+
+
+def print_summary(reports, timer, calls, wall):
+    seconds = sorted(r["seconds"] for r in reports)
+    print(f"\n{len(reports)} cities in {wall:.1f} s ({len(reports) / wall:.1f} cities/s)" if wall else f"\n{len(reports)} cities")
+    if seconds:
+        p95 = seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))]
+        print(f"Per city: median {statistics.median(seconds):.2f} s · p95 {p95:.2f} s · max {seconds[-1]:.2f} s")
+    for stage, total in sorted(timer.totals.items(), key=lambda item: -item[1]):
+        print(f"  {stage:<9} {timer.counts[stage]:>5} calls  {total:8.1f} s total  {total / timer.counts[stage] * 1000:8.0f} ms avg")
+    print(f"Shared calls: {calls.misses} fetched, {calls.hits} reused")
+    print(f"Errors: {sum(bool(r['errors']) for r in reports)} cities with errors · {sum(bool((r.get('aqi') or {}).get('estimated')) for r in reports)} AQI estimated")
+
+
+# -----------------------------------------------------------------------------
+# Command Line
+# -----------------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate an Air 13X air quality report for many cities.")
+    parser.add_argument("cities", nargs="*", help="'city,state,country', 'city,country' or 'lat,lon'")
+    parser.add_argument("--file", help="File with one city per line")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Cities fetched in parallel")
+    parser.add_argument("--format", nargs="+", choices=REPORT_FORMATS, default=list(REPORT_FORMATS))
+    parser.add_argument("--out", default="reports", help="Output directory")
+    args = parser.parse_args(argv)
+
+    specs = list(args.cities)
+    if args.file:
+        with open(args.file, encoding="utf-8") as handle: specs += [line.strip() for line in handle if line.strip() and not line.startswith("#")]
+    if not specs: parser.error("no cities given")
+
+    import app # Deferred: importing the dashboard module pulls in Streamlit
+    api_keys = {name: os.environ.get(f"AIR13X_{name.upper()}_KEY", key) for name, key in app.DEFAULT_API_KEYS.items()}
+    calls = SharedCalls(); timer = StageTimer()
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        reports = list(executor.map(lambda spec: city_report(app, spec, api_keys, calls, timer), specs))
+    fill_estimates(app, reports, api_keys, timer)
+    for report in reports: add_health(app, report)
+    wall = time.perf_counter() - started
+
+    os.makedirs(args.out, exist_ok=True)
+    generated = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    stem = os.path.join(args.out, f"air13x-report-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}")
+    if "json" in args.format: write_json(reports, stem + ".json"); print(f"Wrote {stem}.json")
+    if "html" in args.format: write_html(reports, stem + ".html", generated); print(f"Wrote {stem}.html")
+    print_summary(reports, timer, calls, wall)
+    return 0 if all(r.get("aqi") for r in reports) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
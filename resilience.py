@@ -0,0 +1,300 @@
+"""Circuit breakers and last-good fallbacks for upstream API calls.
+
+Every provider call goes through http_get. Breakers exist per provider (api host) and
+per endpoint, and both must be closed (or admit a half-open probe) for a request to be
+sent. While a breaker is open, calls fail in microseconds with CircuitOpenError instead
+of waiting out their timeout. After reset_timeout one trial call is let through: success
+closes the breaker, failure re-opens it with a longer wait.
+
+Fetch functions wrapped with @last_good_fallback remember their last successful result
+and serve it when a call fails for transport reasons (timeout, connection error, 5xx,
+open circuit); track_stale() tells the caller when that happened and how old the data is.
+
+A deadline() block gives everything inside it one latency budget: each http_get uses
+the remaining time as its timeout, and calls made after the budget is spent fail at
+once with DeadlineExceeded (so the last-good fallback applies).
+"""
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+
+from change_detection import VALIDATORS, request_key
+from scheduler import SCHEDULER, QueueTimeout
+
+
+PROVIDERS = {"api.airvisual.com": "IQAir", "api.openweathermap.org": "OpenWeatherMap", "api.waqi.info": "WAQI"}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request while its breaker is open."""
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Raised when a call is made after its deadline has passed."""
+
+
+class PartialResult(str):
+    """Error of a (data, error) fetch whose data is usable but incomplete (e.g. some history windows failed).
+
+    The caching decorators only keep results whose error is None, so partial data is shown
+    with this message but never cached, snapshotted or stored as last-good.
+    """
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures; open -> half-open after the reset timeout."""
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0, max_reset_timeout=300.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may be sent now. In half-open state only one probe is admitted at a time."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout: self.state = "half-open"
+            if self.state == "closed" or (self.state == "half-open" and not self.probing):
+                self.probing = self.state == "half-open"
+                self.stats["calls"] += 1
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def release(self):
+        """Gives back an admitted probe that was never sent."""
+        with self._lock: self.probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"; self.failures = 0; self.probing = False; self.reset_timeout = self.base_reset_timeout
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1; self.stats["failures"] += 1
+            if self.state == "half-open": self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout) # Failed probe: back off
+            if self.state == "half-open" or self.failures >= self.failure_threshold:
+                if self.state != "open": self.stats["opened"] += 1
+                self.state = "open"; self.opened_at = time.monotonic()
+            self.probing = False
+
+    def retry_in(self):
+        with self._lock: return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)) if self.state == "open" else 0.0
+
+    def snapshot(self):
+        return {"name": self.name, "state": self.state, "failures": self.failures, "retry_in": round(self.retry_in(), 1), **self.stats}
+
+
+class BreakerRegistry:
+    def __init__(self, **breaker_options):
+        self.options = breaker_options
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._breakers: self._breakers[name] = CircuitBreaker(name, **self.options)
+            return self._breakers[name]
+
+    def snapshot(self):
+        with self._lock: breakers = list(self._breakers.values())
+        return [breaker.snapshot() for breaker in sorted(breakers, key=lambda b: b.name)]
+
+
+BREAKERS = BreakerRegistry()
+_transport_failures = contextvars.ContextVar("transport_failures", default=None)
+
+
+def endpoint_name(url):
+    """(provider, endpoint) for a URL, e.g. ('WAQI', 'WAQI /feed'). Per-city/station path parts are dropped."""
+    parts = urlsplit(url)
+    provider = PROVIDERS.get(parts.hostname, parts.hostname)
+    segments = [segment for segment in parts.path.split("/") if segment]
+    if segments[:1] == ["feed"]: segments = segments[:1] # /feed/<city or @station>/
+    return provider, f"{provider} /{'/'.join(segments)}"
+
+
+def http_get(url, params=None, timeout=10, **kwargs):
+    """requests.get guarded by the provider and endpoint breakers and the active deadline.
+
+    The call first waits for a slot from the request scheduler (see scheduler.py), for at
+    most its timeout or the remaining deadline. Stored ETag / Last-Modified validators are
+    sent along, and responses are fingerprinted (see change_detection.py). Timeouts, connection errors and 5xx
+    responses count as failures; other responses (including 4xx such as an invalid key)
+    mean the provider is up. A timeout caused by a deadline cutting the call short, or by
+    waiting for a slot, is not held against the provider.
+    """
+    budget = _deadline.get()
+    try: slot = SCHEDULER.acquire(urlsplit(url).hostname, timeout=min(timeout, max(0.0, budget.remaining())) if budget is not None else timeout)
+    except QueueTimeout:
+        if budget is None: _note_transport_failure("queue"); raise
+        budget.expired += 1; _note_transport_failure("deadline")
+        raise DeadlineExceeded(f"Deadline of {budget.seconds:g} s exceeded waiting for a request slot for {endpoint_name(url)[1]}") from None
+    try: return _guarded_get(url, params, timeout, budget, **kwargs)
+    finally: SCHEDULER.release(slot)
+
+
+def _guarded_get(url, params, timeout, budget, **kwargs):
+    cut_short = False
+    if budget is not None:
+        remaining = budget.remaining()
+        if remaining < MIN_CALL_SECONDS:
+            budget.expired += 1; _note_transport_failure("deadline")
+            raise DeadlineExceeded(f"Deadline of {budget.seconds:g} s exceeded before calling {endpoint_name(url)[1]}")
+        if remaining < timeout: timeout, cut_short = remaining, True
+    breakers = [BREAKERS.get(name) for name in endpoint_name(url)]
+    for i, breaker in enumerate(breakers):
+        if not breaker.allow():
+            for admitted in breakers[:i]: admitted.release()
+            _note_transport_failure(breaker.name)
+            raise CircuitOpenError(f"{breaker.name} unavailable (circuit open, retry in {breaker.retry_in():.0f} s)")
+    key = None if kwargs.get("stream") else request_key(url, params) # Streamed bodies are not read here, so not fingerprinted
+    conditional = VALIDATORS.request_headers(key) if key else {}
+    if conditional: kwargs["headers"] = {**conditional, **(kwargs.get("headers") or {})}
+    try: response = requests.get(url, params=params, timeout=timeout, **kwargs)
+    except requests.exceptions.RequestException as exc:
+        if cut_short and isinstance(exc, requests.exceptions.Timeout):
+            for breaker in breakers: breaker.release()
+            budget.expired += 1; _note_transport_failure("deadline")
+            raise DeadlineExceeded(f"Deadline of {budget.seconds:g} s exceeded waiting for {breakers[-1].name}") from exc
+        for breaker in breakers: breaker.record_failure()
+        _note_transport_failure(breakers[-1].name)
+        raise
+    except Exception:
+        for breaker in breakers: breaker.release()
+        raise
+    if response.status_code >= 500:
+        breakers[-1].record_failure(); breakers[0].record_success() # The host answered; only this endpoint is failing
+        _note_transport_failure(breakers[-1].name)
+    else:
+        for breaker in breakers: breaker.record_success()
+        if key: response = VALIDATORS.observe(key, response)
+    return response
+
+
+# -----------------------------------------------------------------------------
+# Deadlines
+# -----------------------------------------------------------------------------
+MIN_CALL_SECONDS = 0.05 # Less time than this left -> fail without sending
+
+
+class Deadline:
+    """One latency budget shared by every call in a deadline() block, with per-dataset outcomes."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.expired = 0 # Calls refused or cut short by this deadline
+        self.outcomes = {} # dataset -> {"outcome", "ms"}
+        self._last_mark = self.started; self._last_expired = 0
+
+    def remaining(self): return self.seconds - (time.monotonic() - self.started)
+
+    def elapsed_ms(self): return (time.monotonic() - self.started) * 1000
+
+    def record(self, dataset, stale=False, error=None):
+        """Outcome of the dataset fetched since the previous record: ok, stale, timeout or error."""
+        now = time.monotonic()
+        hit_deadline = self.expired > self._last_expired
+        outcome = "stale" if stale else ("timeout" if error and hit_deadline else ("error" if error else "ok"))
+        self.outcomes[dataset] = {"outcome": outcome, "ms": round((now - self._last_mark) * 1000)}
+        self._last_mark = now; self._last_expired = self.expired
+        return outcome
+
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    budget = Deadline(seconds); token = _deadline.set(budget)
+    try: yield budget
+    finally: _deadline.reset(token)
+
+
+def current_deadline(): return _deadline.get()
+
+
+def _note_transport_failure(name):
+    failures = _transport_failures.get()
+    if failures is not None: failures.append(name)
+
+
+# -----------------------------------------------------------------------------
+# Last-Good Fallback
+# -----------------------------------------------------------------------------
+class LastGoodStore:
+    """Bounded LRU of the last successful result per call, shared by all sessions of the process."""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key, data):
+        with self._lock:
+            self._entries[key] = (time.time(), data); self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None: self._entries.move_to_end(key)
+            return entry
+
+
+LAST_GOOD = LastGoodStore()
+_served_stale = contextvars.ContextVar("served_stale", default=None)
+
+
+def last_good_fallback(func):
+    """Wraps a fetch returning (data, error): stores good results and serves the last one on transport failures."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        failures = []; token = _transport_failures.set(failures)
+        try: data, error = func(*args, **kwargs)
+        finally: _transport_failures.reset(token)
+        key = (func.__qualname__,) + args + tuple(sorted(kwargs.items()))
+        if error is None and data is not None:
+            LAST_GOOD.put(key, data)
+            return data, error
+        entry = LAST_GOOD.get(key) if failures else None
+        if entry is None: return data, error
+        stale = _served_stale.get()
+        if stale is not None: stale.append({"source": func.__name__, "stored_at": entry[0], "reason": error})
+        return entry[1], None
+    return wrapper
+
+
+@contextlib.contextmanager
+def track_stale():
+    """Collects fallbacks served inside the block: a list of {source, stored_at, reason} dicts."""
+    stale = []; token = _served_stale.set(stale)
+    try: yield stale
+    finally: _served_stale.reset(token)
+
+
+def in_context(func):
+    """Binds func to a copy of the current context, so executor threads report into the caller's trackers."""
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+def drain_stale():
+    """Returns and clears the fallbacks collected so far by the innermost track_stale() block."""
+    stale = _served_stale.get()
+    if not stale: return []
+    drained = list(stale); stale.clear()
+    return drained
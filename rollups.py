@@ -0,0 +1,191 @@
+"""Multi-resolution rollups of hourly pollutant history, kept per location in SQLite.
+
+Hourly readings (every OWM pollutant plus the computed US AQI) are ingested as they are
+fetched. Each ingest stores the new hours and recomputes only the day and month buckets
+they fall into: min, mean, max and p95 per metric over the hours in the bucket. Queries
+are answered from the coarsest level that still gives the requested resolution, so a
+year-long chart reads ~365 daily rows instead of 8,760 hours, whatever the city count.
+
+Hourly rows are kept for HOURLY_RETENTION_DAYS; day and month rollups are kept for good.
+The file is AIR13X_ROLLUPS (default rollups.db in the user cache dir, $XDG_CACHE_HOME/air13x);
+set it to "" to disable. It is created on first use, not at import.
+"""
+import os
+import sqlite3
+import threading
+import time
+import warnings
+
+import numpy as np
+
+from history import HISTORY_POLLUTANTS, PollutantHistory
+
+
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "air13x")
+ROLLUPS_PATH = os.environ.get("AIR13X_ROLLUPS", os.path.join(CACHE_DIR, "rollups.db"))
+HOURLY_RETENTION_DAYS = 400
+METRICS = tuple(HISTORY_POLLUTANTS) + ("aqi",)
+STATS = ("min", "mean", "max", "p95")
+LEVELS = {"hour": 3600, "day": 86400, "month": 30 * 86400} # Nominal bucket seconds, for planning
+
+
+def bucket_starts(timestamps, level):
+    """Start (Unix seconds, UTC) of the bucket each timestamp falls into."""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if level == "month": return timestamps.astype("datetime64[s]").astype("datetime64[M]").astype("datetime64[s]").astype(np.int64)
+    return timestamps - timestamps % LEVELS[level]
+
+
+def aggregate(timestamps, values, level):
+    """(bucket starts, hour counts, stats) of sorted hourly values (n, len(METRICS)); stats is (buckets, len(STATS), len(METRICS)), NaN-aware."""
+    starts = bucket_starts(timestamps, level)
+    buckets, first = np.unique(starts, return_index=True)
+    if not len(buckets): return buckets, np.zeros(0, dtype=np.int64), np.zeros((0, len(STATS), len(METRICS)))
+    ends = np.append(first[1:], len(starts))
+    known = np.isfinite(values); filled = np.where(known, values, 0.0)
+    readings = np.add.reduceat(known, first, axis=0); sums = np.add.reduceat(filled, first, axis=0) # Per bucket and metric
+    stats = np.full((len(buckets), len(STATS), len(METRICS)), np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stats[:, 0] = np.where(readings, np.fmin.reduceat(values, first, axis=0), np.nan) # fmin/fmax skip NaN
+        stats[:, 1] = np.where(readings, sums / readings, np.nan)
+        stats[:, 2] = np.where(readings, np.fmax.reduceat(values, first, axis=0), np.nan)
+    for i, (start, end) in enumerate(zip(first, ends)):
+        with np.errstate(invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning) # All-NaN metric in a bucket -> NaN
+            stats[i, 3] = np.nanpercentile(values[start:end], 95, axis=0)
+    return buckets, ends - first, stats
+
+
+def choose_level(start, end, max_points):
+    """The finest level that draws [start, end) in at most max_points buckets (coarser levels only lose detail)."""
+    for level, seconds in LEVELS.items():
+        if (end - start) / seconds <= max_points: return level
+    return "month"
+
+
+class RollupSeries:
+    """Query result: bucket starts, hours per bucket and stats (buckets, STATS, METRICS) at one level."""
+
+    __slots__ = ("level", "buckets", "counts", "stats")
+
+    def __init__(self, level, buckets, counts, stats):
+        self.level = level; self.buckets = buckets; self.counts = counts; self.stats = stats
+
+    def column(self, metric, stat="mean"):
+        return self.stats[:, STATS.index(stat), METRICS.index(metric)]
+
+    def to_history(self, stat="mean"):
+        """One statistic as a PollutantHistory (one point per bucket), e.g. for the history chart."""
+        s = STATS.index(stat)
+        return PollutantHistory(self.buckets, {key: self.stats[:, s, i] for i, key in enumerate(HISTORY_POLLUTANTS)}, self.stats[:, s, -1])
+
+    def __len__(self): return len(self.buckets)
+
+    def __repr__(self): return f"RollupSeries({len(self)} {self.level} buckets)"
+
+
+class RollupStore:
+    """Hourly rows plus day/month rollups per location, one connection per thread (like cache_backend.SQLiteBackend).
+
+    The file and its schema are created by the first connection, so a store nobody writes to leaves no file behind.
+    """
+
+    def __init__(self, path, retention_days=HOURLY_RETENTION_DAYS):
+        self.path = path
+        self.retention = retention_days * 86400
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self.stats = {"ingested_hours": 0, "rollups_written": 0, "queries": 0, "rows_read": 0, "ingest_ms": 0.0}
+        self._opened = False
+
+    @property
+    def exists(self):
+        """Whether the store has a file yet (reads of a store that was never written return nothing)."""
+        return self._opened or os.path.exists(self.path)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._write_lock:
+                if not self._opened and os.path.dirname(self.path): os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                conn = self._local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL"); conn.execute("PRAGMA synchronous=NORMAL")
+                if not self._opened: self._create_schema(conn); self._opened = True
+        return conn
+
+    @staticmethod
+    def _create_schema(conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS hourly (location TEXT NOT NULL, ts INTEGER NOT NULL, value BLOB NOT NULL, PRIMARY KEY (location, ts)) WITHOUT ROWID")
+        conn.execute("CREATE TABLE IF NOT EXISTS rollup (location TEXT NOT NULL, level TEXT NOT NULL, bucket INTEGER NOT NULL, hours INTEGER NOT NULL, stats BLOB NOT NULL, PRIMARY KEY (location, level, bucket)) WITHOUT ROWID")
+        conn.execute("CREATE TABLE IF NOT EXISTS location (location TEXT PRIMARY KEY, label TEXT, updated_at REAL)")
+
+    def ingest(self, location, history, label=None):
+        """Stores the hours of a PollutantHistory not seen before and refreshes the day/month buckets they touch. Returns the new hour count."""
+        started = time.perf_counter()
+        keep = history.timestamps >= time.time() - self.retention
+        timestamps = history.timestamps[keep]
+        if not len(timestamps): return 0
+        values = np.column_stack([history.columns[key][keep] for key in HISTORY_POLLUTANTS] + [history.aqi[keep]])
+        conn = self._conn()
+        with self._write_lock:
+            known = {row[0] for row in conn.execute("SELECT ts FROM hourly WHERE location = ? AND ts BETWEEN ? AND ?", (location, int(timestamps[0]), int(timestamps[-1])))}
+            new = np.array([int(ts) not in known for ts in timestamps.tolist()], dtype=bool)
+            if new.any():
+                conn.execute("BEGIN")
+                try:
+                    conn.executemany("INSERT OR REPLACE INTO hourly (location, ts, value) VALUES (?, ?, ?)",
+                                     [(location, int(ts), row.tobytes()) for ts, row in zip(timestamps[new].tolist(), values[new])])
+                    self._refresh(conn, location, timestamps[new])
+                    conn.execute("DELETE FROM hourly WHERE location = ? AND ts < ?", (location, int(time.time() - self.retention)))
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK"); raise
+            conn.execute("INSERT INTO location (location, label, updated_at) VALUES (?, ?, ?) ON CONFLICT(location) DO UPDATE SET label = coalesce(excluded.label, label), updated_at = excluded.updated_at",
+                         (location, label, time.time()))
+        added = int(new.sum())
+        self.stats["ingested_hours"] += added; self.stats["ingest_ms"] += (time.perf_counter() - started) * 1000
+        return added
+
+    def _refresh(self, conn, location, new_timestamps):
+        """Recomputes the day and month buckets containing new hours from the stored hourly rows."""
+        months = np.unique(bucket_starts(new_timestamps, "month"))
+        span_start = int(months[0]); span_end = int(bucket_starts([months[-1] + 32 * 86400], "month")[0])
+        timestamps, values = self._hourly(conn, location, span_start, span_end)
+        for level in ("day", "month"):
+            touched = set(np.unique(bucket_starts(new_timestamps, level)).tolist())
+            buckets, counts, stats = aggregate(timestamps, values, level)
+            rows = [(location, level, bucket, count, block.tobytes()) for bucket, count, block in zip(buckets.tolist(), counts.tolist(), stats) if bucket in touched]
+            conn.executemany("INSERT OR REPLACE INTO rollup (location, level, bucket, hours, stats) VALUES (?, ?, ?, ?, ?)", rows)
+            self.stats["rollups_written"] += len(rows)
+
+    def _hourly(self, conn, location, start, end):
+        rows = conn.execute("SELECT ts, value FROM hourly WHERE location = ? AND ts >= ? AND ts < ? ORDER BY ts", (location, start, end)).fetchall()
+        self.stats["rows_read"] += len(rows)
+        timestamps = np.array([row[0] for row in rows], dtype=np.int64)
+        values = np.frombuffer(b"".join(row[1] for row in rows), dtype=float).reshape(len(rows), len(METRICS))
+        return timestamps, values
+
+    def query(self, location, start, end, level=None, max_points=500):
+        """RollupSeries for [start, end) at `level`, or at the coarsest level that keeps the range within max_points buckets."""
+        level = level or choose_level(start, end, max_points)
+        if not self.exists: return RollupSeries(level, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros((0, len(STATS), len(METRICS))))
+        conn = self._conn(); self.stats["queries"] += 1
+        if level == "hour":
+            timestamps, values = self._hourly(conn, location, int(start), int(end))
+            return RollupSeries(level, timestamps, np.ones(len(timestamps), dtype=np.int64), np.repeat(values[:, None, :], len(STATS), axis=1))
+        rows = conn.execute("SELECT bucket, hours, stats FROM rollup WHERE location = ? AND level = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+                            (location, level, int(bucket_starts([start], level)[0]), int(end))).fetchall()
+        self.stats["rows_read"] += len(rows)
+        stats = np.frombuffer(b"".join(row[2] for row in rows), dtype=float).reshape(len(rows), len(STATS), len(METRICS))
+        return RollupSeries(level, np.array([row[0] for row in rows], dtype=np.int64), np.array([row[1] for row in rows], dtype=np.int64), stats)
+
+    def locations(self):
+        """{location: label} for every tracked location."""
+        return dict(self._conn().execute("SELECT location, label FROM location ORDER BY updated_at DESC").fetchall())
+
+    def snapshot(self):
+        """Counters plus the tracked location count; does not create the file if nothing was ingested yet."""
+        return {"path": self.path, "locations": self._conn().execute("SELECT count(*) FROM location").fetchone()[0] if self.exists else 0, **self.stats}
+
+
+ROLLUPS = RollupStore(ROLLUPS_PATH) if ROLLUPS_PATH else None
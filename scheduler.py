@@ -0,0 +1,156 @@
+"""Priority-aware scheduling of outgoing provider requests.
+
+Every http_get (see resilience.py) first takes a slot from the process-wide SCHEDULER.
+Requests belong to one of three classes, most urgent first:
+
+    interactive  what the user just asked for (coordinates, current AQI and weather)
+    secondary    other on-screen panels (history, forecasts, nearby stations, map)
+    background   bulk and automatic work (ranking fan-out, live refresh, alerts, revalidation)
+
+Slots are limited globally (AIR13X_MAX_REQUESTS) and per host (AIR13X_MAX_REQUESTS_PER_HOST).
+Less urgent classes may only fill part of the global limit (CLASS_SHARE), so a slow
+background batch always leaves room for an interactive call. Waiting requests are
+granted by class, then round-robin across sessions, so one session's fan-out cannot
+monopolise a class; a request held back by its host's limit does not block requests
+to other hosts. Queue wait is recorded per class.
+
+The class and session of a request come from context: request_priority() and
+request_session() blocks (carried into executor threads by resilience.in_context).
+"""
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import requests
+
+
+PRIORITIES = ("interactive", "secondary", "background")
+DEFAULT_PRIORITY = "secondary" # Calls made outside any request_priority() block
+CLASS_SHARE = {"interactive": 1.0, "secondary": 0.75, "background": 0.5} # Share of the global limit a class may fill
+MAX_REQUESTS = int(os.environ.get("AIR13X_MAX_REQUESTS", 12))
+MAX_REQUESTS_PER_HOST = int(os.environ.get("AIR13X_MAX_REQUESTS_PER_HOST", 6))
+WAIT_SAMPLES = 256 # Recent queue waits kept per class for percentiles
+
+
+class QueueTimeout(requests.exceptions.Timeout):
+    """Raised when no request slot became free within the caller's timeout."""
+
+
+_priority = contextvars.ContextVar("request_priority", default=None)
+_session = contextvars.ContextVar("request_session", default="")
+
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """Requests made inside the block use `priority`; nested blocks can only make it less urgent."""
+    current = _priority.get()
+    if current is not None and PRIORITIES.index(current) > PRIORITIES.index(priority): priority = current
+    token = _priority.set(priority)
+    try: yield
+    finally: _priority.reset(token)
+
+
+@contextlib.contextmanager
+def request_session(session_id):
+    """Requests made inside the block are queued fairly against other sessions' requests."""
+    token = _session.set(session_id or "")
+    try: yield
+    finally: _session.reset(token)
+
+
+def current_priority(): return _priority.get() or DEFAULT_PRIORITY
+
+
+class _Waiter:
+    __slots__ = ("host", "priority", "session", "queued_at", "granted")
+
+    def __init__(self, host, priority, session):
+        self.host = host; self.priority = priority; self.session = session
+        self.queued_at = time.monotonic(); self.granted = False
+
+
+class RequestScheduler:
+    """Grants request slots by class, then round-robin across sessions, within global, per-class and per-host limits."""
+
+    def __init__(self, max_concurrent=MAX_REQUESTS, per_host=MAX_REQUESTS_PER_HOST, class_share=CLASS_SHARE):
+        self.max_concurrent = max_concurrent
+        self.per_host = per_host
+        self.class_limits = {priority: max(1, int(max_concurrent * class_share[priority])) for priority in PRIORITIES}
+        self.in_flight = 0
+        self._host_in_flight = {}
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES} # priority -> session -> deque of waiters
+        self._cond = threading.Condition()
+        self.stats = {priority: {"requests": 0, "started": 0, "queued": 0, "timeouts": 0, "wait_ms": 0.0, "max_wait_ms": 0.0, "in_flight": 0} for priority in PRIORITIES}
+        self._waits = {priority: deque(maxlen=WAIT_SAMPLES) for priority in PRIORITIES}
+
+    def _can_start(self, waiter):
+        return self.in_flight < self.class_limits[waiter.priority] and self._host_in_flight.get(waiter.host, 0) < self.per_host
+
+    def _grant(self, waiter):
+        waiter.granted = True
+        self.in_flight += 1; self._host_in_flight[waiter.host] = self._host_in_flight.get(waiter.host, 0) + 1
+        waited_ms = (time.monotonic() - waiter.queued_at) * 1000
+        stats = self.stats[waiter.priority]
+        stats["started"] += 1; stats["in_flight"] += 1; stats["wait_ms"] += waited_ms; stats["max_wait_ms"] = max(stats["max_wait_ms"], waited_ms)
+        self._waits[waiter.priority].append(waited_ms)
+
+    def _dispatch(self):
+        """Grants every waiter that can start: most urgent class first, sessions in round-robin order."""
+        granted = False
+        for priority in PRIORITIES:
+            sessions = self._queues[priority]
+            progress = True
+            while progress and sessions:
+                progress = False
+                for session in list(sessions):
+                    queue = sessions[session]
+                    waiter = next((w for w in queue if self._can_start(w)), None) # Skip past requests held by their host's limit
+                    if waiter is None: continue
+                    queue.remove(waiter); self._grant(waiter); granted = progress = True
+                    if queue: sessions.move_to_end(session) # This session goes to the back of the round
+                    else: del sessions[session]
+        return granted
+
+    def acquire(self, host, priority=None, session=None, timeout=None):
+        """Waits for a slot and returns it (pass it to release()). Raises QueueTimeout after `timeout` seconds."""
+        waiter = _Waiter(host, priority or current_priority(), _session.get() if session is None else session)
+        stats = self.stats[waiter.priority]
+        with self._cond:
+            stats["requests"] += 1
+            self._queues[waiter.priority].setdefault(waiter.session, deque()).append(waiter)
+            if self._dispatch(): self._cond.notify_all()
+            if waiter.granted: return waiter
+            stats["queued"] += 1
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not waiter.granted:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    queue = self._queues[waiter.priority].get(waiter.session)
+                    queue.remove(waiter)
+                    if not queue: del self._queues[waiter.priority][waiter.session]
+                    stats["timeouts"] += 1
+                    raise QueueTimeout(f"No request slot for {host} within {timeout:.1f} s ({waiter.priority})")
+                self._cond.wait(remaining)
+        return waiter
+
+    def release(self, slot):
+        with self._cond:
+            self.in_flight -= 1; self._host_in_flight[slot.host] -= 1; self.stats[slot.priority]["in_flight"] -= 1
+            self._dispatch(); self._cond.notify_all()
+
+    def snapshot(self):
+        """Per-class counters plus waiting requests and mean/p95 queue wait (ms)."""
+        with self._cond:
+            result = {}
+            for priority in PRIORITIES:
+                waits = sorted(self._waits[priority]); stats = self.stats[priority]
+                result[priority] = {**stats, "waiting": sum(len(queue) for queue in self._queues[priority].values()),
+                                    "mean_wait_ms": stats["wait_ms"] / stats["started"] if stats["started"] else 0.0,
+                                    "p95_wait_ms": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0}
+            return result
+
+
+SCHEDULER = RequestScheduler()
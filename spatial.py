@@ -0,0 +1,161 @@
+"""Vectorized spatial interpolation of station readings (inverse-distance weighting).
+
+Stations and query points are turned into unit vectors on the sphere, so the distances
+between a block of query points and every station are one matrix product. Query points
+are processed in fixed-size blocks, so memory stays bounded for large grids and batches.
+Geohash helpers snap coordinates to cells, e.g. for cache keys shared by nearby lookups.
+"""
+import numpy as np
+
+
+EARTH_RADIUS_KM = 6371.0
+IDW_NEIGHBOURS = 8 # Stations that contribute to each estimate
+IDW_POWER = 2
+BLOCK_SIZE = 2048 # Query points per distance block
+
+
+def unit_vectors(lat, lon):
+    """(n, 3) unit vectors for latitude/longitude arrays in degrees."""
+    lat = np.radians(np.asarray(lat, dtype=float)); lon = np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def nearest_stations(query_lat, query_lon, station_lat, station_lon, k=IDW_NEIGHBOURS, block_size=BLOCK_SIZE):
+    """Great-circle distances (km) and indices of the k nearest stations per query point, nearest first."""
+    stations = unit_vectors(station_lat, station_lon); stations32 = stations.astype(np.float32)
+    queries = unit_vectors(np.ravel(query_lat), np.ravel(query_lon))
+    k = min(k, len(stations))
+    distances = np.empty((len(queries), k)); indices = np.empty((len(queries), k), dtype=np.int64)
+    for start in range(0, len(queries), block_size):
+        block = queries[start:start + block_size]
+        cosine = block.astype(np.float32) @ stations32.T # Larger cosine = closer; float32 is enough to pick neighbours
+        nearest = np.argmax(cosine, axis=1)[:, None] if k == 1 else np.argpartition(-cosine, k - 1, axis=1)[:, :k] # argmax is far cheaper for one neighbour
+        chord = np.linalg.norm(block[:, None, :] - stations[nearest], axis=2) # Exact distances for the k picked only
+        order = np.argsort(chord, axis=1)
+        distances[start:start + len(block)] = 2 * np.arcsin(np.minimum(np.take_along_axis(chord, order, axis=1) / 2, 1.0)) * EARTH_RADIUS_KM
+        indices[start:start + len(block)] = np.take_along_axis(nearest, order, axis=1)
+    return distances, indices
+
+
+def idw(query_lat, query_lon, station_lat, station_lon, values, k=IDW_NEIGHBOURS, power=IDW_POWER, max_distance_km=None):
+    """Inverse-distance-weighted estimates at the query points.
+
+    Returns (estimates, nearest_km). Points whose nearest station is farther than
+    max_distance_km get NaN; a point on top of a station takes that station's value.
+    """
+    values = np.asarray(values, dtype=float)
+    shape = np.shape(query_lat)
+    if not len(values): return np.full(shape, np.nan), np.full(shape, np.inf)
+    distances, indices = nearest_stations(query_lat, query_lon, station_lat, station_lon, k=k)
+    with np.errstate(divide="ignore"):
+        weights = 1.0 / np.maximum(distances, 1e-6) ** power
+    estimates = (weights * values[indices]).sum(axis=1) / weights.sum(axis=1)
+    nearest_km = distances[:, 0]
+    if max_distance_km is not None: estimates = np.where(nearest_km <= max_distance_km, estimates, np.nan)
+    return estimates.reshape(shape), nearest_km.reshape(shape)
+
+
+def mercator_latitudes(lat1, lat2, rows):
+    """Latitudes north -> south whose rows are evenly spaced in Web Mercator, so a grid image lines up on a web map."""
+    lat1, lat2 = max(lat1, -85.0), min(lat2, 85.0)
+    y1, y2 = np.log(np.tan(np.pi / 4 + np.radians([lat1, lat2]) / 2))
+    y = np.linspace(y2, y1, rows)
+    return np.degrees(2 * np.arctan(np.exp(y)) - np.pi / 2)
+
+
+def idw_grid(lat1, lon1, lat2, lon2, station_lat, station_lon, values, width=160, height=160, max_distance_km=None, **kwargs):
+    """IDW surface on a width x height grid over the bounding box (row 0 is the northern edge).
+
+    Returns (grid, lats, lons); grid cells without a station within max_distance_km are NaN.
+    """
+    lats = mercator_latitudes(lat1, lat2, height); lons = np.linspace(lon1, lon2, width)
+    grid_lat, grid_lon = np.meshgrid(lats, lons, indexing="ij")
+    grid, _ = idw(grid_lat, grid_lon, station_lat, station_lon, values, max_distance_km=max_distance_km, **kwargs)
+    return grid, lats, lons
+
+
+def idw_estimate(query_lat, query_lon, station_lat, station_lon, values, k=IDW_NEIGHBOURS, power=IDW_POWER, max_distance_km=50.0, distance_scale_km=25.0):
+    """Point estimates with a confidence in [0, 1] for a batch of query points.
+
+    Only neighbours within max_distance_km contribute. Confidence falls with the weighted
+    distance to those stations, with fewer than three of them, and with disagreement
+    between them. Returns a dict of flat arrays: estimate (NaN with no station in range),
+    confidence, nearest_km and stations (neighbours used).
+    """
+    values = np.asarray(values, dtype=float)
+    count = np.size(query_lat)
+    if not len(values): return {"estimate": np.full(count, np.nan), "confidence": np.zeros(count), "nearest_km": np.full(count, np.inf), "stations": np.zeros(count, dtype=np.int64)}
+    distances, indices = nearest_stations(query_lat, query_lon, station_lat, station_lon, k=k)
+    in_range = distances <= max_distance_km
+    weights = np.where(in_range, 1.0 / np.maximum(distances, 1e-6) ** power, 0.0)
+    total = weights.sum(axis=1); used = in_range.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weights = weights / total[:, None]
+        neighbour_values = values[indices]
+        estimate = (weights * neighbour_values).sum(axis=1)
+        spread = np.sqrt((weights * (neighbour_values - estimate[:, None]) ** 2).sum(axis=1))
+        mean_km = (weights * distances).sum(axis=1)
+        confidence = np.exp(-mean_km / distance_scale_km) * np.minimum(used / 3.0, 1.0) / (1.0 + spread / 50.0)
+    has_station = used > 0
+    return {"estimate": np.where(has_station, estimate, np.nan), "confidence": np.where(has_station, np.clip(confidence, 0.0, 1.0), 0.0),
+            "nearest_km": distances[:, 0], "stations": used}
+
+
+def aggregate_by_nearest(point_lat, point_lon, values, centre_lat, centre_lon, max_distance_km=40.0):
+    """Assigns every point to its nearest centre (within max_distance_km) and aggregates its values per centre.
+
+    One vectorized pass: nearest-centre search, then a single sort by (centre, value) from which
+    each centre's count, max and median are read off. Returns a dict of arrays over the centres
+    (max and median are NaN for centres without a point).
+    """
+    values = np.asarray(values, dtype=float); centres = len(centre_lat)
+    result = {"count": np.zeros(centres, dtype=np.int64), "max": np.full(centres, np.nan), "median": np.full(centres, np.nan)}
+    if not len(values) or not centres: return result
+    distances, indices = nearest_stations(point_lat, point_lon, centre_lat, centre_lon, k=1)
+    keep = (distances[:, 0] <= max_distance_km) & np.isfinite(values)
+    centre = indices[keep, 0]; values = values[keep]
+    order = np.lexsort((values, centre)); centre = centre[order]; values = values[order]
+    count = np.bincount(centre, minlength=centres); ends = np.cumsum(count); starts = ends - count
+    has = count > 0
+    result["count"] = count
+    result["max"][has] = values[ends[has] - 1]
+    result["median"][has] = (values[starts[has] + (count[has] - 1) // 2] + values[starts[has] + count[has] // 2]) / 2
+    return result
+
+
+# -----------------------------------------------------------------------------
+# Geohash Cells
+# -----------------------------------------------------------------------------
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat, lon, precision=5):
+    """Geohash of the cell containing (lat, lon); each character adds 5 bits (precision 5 is about 4.9 x 4.9 km)."""
+    bounds = [[-90.0, 90.0], [-180.0, 180.0]] # lat, lon
+    cell = []; bits = 0; even = True # Even bits split longitude, odd bits latitude
+    for bit in range(precision * 5):
+        interval = bounds[1] if even else bounds[0]; value = lon if even else lat
+        middle = (interval[0] + interval[1]) / 2
+        if value >= middle: bits = bits * 2 + 1; interval[0] = middle
+        else: bits = bits * 2; interval[1] = middle
+        even = not even
+        if bit % 5 == 4: cell.append(GEOHASH_ALPHABET[bits]); bits = 0
+    return "".join(cell)
+
+
+def geohash_bounds(cell):
+    """(south, west, north, east) of a geohash cell."""
+    bounds = [[-90.0, 90.0], [-180.0, 180.0]]; even = True
+    for char in cell:
+        bits = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            interval = bounds[1] if even else bounds[0]
+            interval[0 if bits >> shift & 1 else 1] = (interval[0] + interval[1]) / 2
+            even = not even
+    return bounds[0][0], bounds[1][0], bounds[0][1], bounds[1][1]
+
+
+def geohash_center(cell):
+    south, west, north, east = geohash_bounds(cell)
+    return (south + north) / 2, (west + east) / 2
@@ -0,0 +1,42 @@
+"""HTML card templates for the dashboard, compiled once at import.
+
+Each template is a string.Template, so a rerun only substitutes (escaped) values. The
+card styles live in static/air13x-cards.css and are read once per process, then inlined
+by render_styles: Streamlit's static serving sends anything but images as text/plain with
+nosniff, so browsers refuse it as a <link> stylesheet. Cards are plain HTML (no scripts),
+so they render in the page itself instead of one iframe each.
+"""
+import functools
+import html
+import os
+from string import Template
+
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+CARDS_CSS = "air13x-cards.css"
+
+# Kept on single lines: indented HTML would be read as a Markdown code block by st.markdown.
+AQI_CARD = Template(
+    '<div class="aqi-container">'
+    '<div class="aqi-label">AQI</div>'
+    '<div class="custom-aqi-number" role="img" aria-label="AQI $aqi" style="--aqi: $aqi; --aqi-color: $color; --aqi-glow: ${color}aa; --aqi-glow-outer: ${color}66;"></div>'
+    '<div class="custom-aqi-category">$category</div>'
+    '</div>'
+)
+HEALTH_CARD = Template(
+    '<div class="health-card">'
+    '<div class="health-title">$category ($aqi)</div>'
+    '<div class="health-description">$recommendation</div>'
+    '</div>'
+)
+
+
+def render(template, **values):
+    """Substitutes HTML-escaped values into a compiled template."""
+    return template.substitute({key: html.escape(str(value)) for key, value in values.items()})
+
+
+@functools.lru_cache(maxsize=None)
+def static_css(name=CARDS_CSS):
+    """Contents of a stylesheet in static/, read once per process."""
+    with open(os.path.join(STATIC_DIR, name), encoding="utf-8") as handle: return handle.read()
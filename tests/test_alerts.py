@@ -0,0 +1,47 @@
+from alerts import AlertEngine, MemorySink
+from aqi_engine import CategoryLookup
+
+LOOKUP = CategoryLookup({(0, 150): {"label": "Moderate", "color": "yellow"}, (151, 500): {"label": "Unhealthy", "color": "red"}})
+
+
+def engine_with(readings, **options):
+    calls = []
+    def fetch(location, context):
+        calls.append((location, context)); return readings[location], None
+    engine = AlertEngine(fetch, LOOKUP, sinks={"memory": MemorySink()}, interval=60, max_workers=1, **options)
+    return engine, calls
+
+
+def test_owner_subscriptions_expire_without_heartbeat():
+    engine, calls = engine_with({"dhaka": 100, "delhi": 100}, owner_ttl=600)
+    engine.subscribe("dhaka", 151, sink="memory", context="key-a", owner="a")
+    engine.subscribe("delhi", 151, sink="memory", context="key-a", owner="a")
+    engine.subscribe("dhaka", 101, sink="memory", context="key-b", owner="b")
+    now = engine.next_due() + 1
+    engine.touch("a", now=now); engine.touch("b", now=now)
+    engine.run_due(now)
+    engine.touch("b", now=now + 500)
+    engine.run_due(now + 601) # "a" missed its heartbeats
+    assert {sub.owner for sub in engine.subscriptions()} == {"b"} and engine.stats["expired_subscriptions"] == 2
+    assert calls[-1] == ("dhaka", "key-b") # The expired session's key is no longer used
+
+
+def test_subscriptions_by_owner_span_locations():
+    engine, _ = engine_with({})
+    engine.subscribe("dhaka", 151, sink="memory", owner="a"); engine.subscribe("delhi", 151, sink="memory", owner="a")
+    engine.subscribe("dhaka", 151, sink="memory", owner="b")
+    assert {sub.location for sub in engine.subscriptions(owner="a")} == {"dhaka", "delhi"}
+    assert engine.unsubscribe_owner("a") == 2
+    assert [sub.owner for sub in engine.subscriptions()] == ["b"]
+
+
+def test_later_subscriber_gets_first_notification():
+    engine, _ = engine_with({"dhaka": 160})
+    engine.subscribe("dhaka", 151, sink="memory")
+    now = engine.next_due() + 1
+    assert [alert["direction"] for alert in engine.run_due(now)] == ["entered"]
+    late = engine.subscribe("dhaka", 151, sink="memory"); engine.subscribe("dhaka", 201, sink="memory")
+    dropped = engine.subscribe("dhaka", 101, sink="memory"); engine.unsubscribe(dropped)
+    alerts = engine.run_due(now + 1) # Not due yet: only the pending first notification is delivered
+    assert [(alert["subscription_id"], alert["direction"], alert["aqi"], alert["previous_aqi"]) for alert in alerts] == [(late, "entered", 160, None)]
+    assert engine.run_due(now + 2) == []
@@ -0,0 +1,60 @@
+import math
+
+import numpy as np
+import pytest
+
+from aqi_engine import CategoryLookup, aqi_from_owm_components, composite_aqi, pollutant_aqi, ugm3_to_epa_units
+
+
+@pytest.mark.parametrize("pollutant, concentration, expected", [
+    ("pm2_5", 0.0, 0), ("pm2_5", 9.0, 50), ("pm2_5", 9.05, 50), ("pm2_5", 9.1, 51), ("pm2_5", 35.4, 100), ("pm2_5", 35.5, 101),
+    ("pm2_5", 225.4, 300), ("pm2_5", 225.5, 301), ("pm2_5", 325.4, 500), ("pm2_5", 400.0, 500),
+    ("pm10", 54, 50), ("pm10", 55, 51), ("pm10", 604, 500),
+    ("co", 4.4, 50), ("co", 4.5, 51), ("co", 4.49, 50),
+    ("no2", 53, 50), ("no2", 54, 51), ("so2", 35, 50), ("so2", 36, 51),
+])
+def test_breakpoint_edges(pollutant, concentration, expected):
+    assert pollutant_aqi(pollutant, concentration) == expected
+
+
+@pytest.mark.parametrize("ppb, expected", [
+    (54, 50), (55, 51), (105, 200), (106, 201), (200, 300), # 8-hour table
+    (201, 300), (300, 300), (404, 300), # Between the tables: capped at the top of the 8-hour table
+    (405, 301), (604, 500), (605, 500), # 1-hour table for Hazardous, then capped
+])
+def test_o3_switches_from_8h_to_1h_table(ppb, expected):
+    assert pollutant_aqi("o3", ppb) == expected
+
+
+def test_missing_and_negative_concentrations_are_nan():
+    result = pollutant_aqi("pm2_5", [np.nan, -1.0, 12.0])
+    assert math.isnan(result[0]) and math.isnan(result[1]) and result[2] == 56
+
+
+def test_unknown_pollutant_raises():
+    with pytest.raises(ValueError): pollutant_aqi("nh3", 1.0)
+
+
+def test_gas_conversion_to_epa_units():
+    assert ugm3_to_epa_units("o3", 48.0 / 24.45) == pytest.approx(1.0) # 1 ppb
+    assert ugm3_to_epa_units("co", 28.01 / 24.45 * 1000) == pytest.approx(1.0) # 1 ppm
+    assert ugm3_to_epa_units("pm10", 20.0) == 20.0
+
+
+def test_composite_takes_dominant_sub_index():
+    aqi, dominant = composite_aqi({"pm2_5": [12.0, np.nan], "o3": [80, np.nan], "co": None})
+    assert aqi[0] == 132 and dominant[0] == "o3"
+    assert math.isnan(aqi[1]) and dominant[1] is None
+
+
+def test_owm_components_are_converted_from_ugm3():
+    aqi, dominant = aqi_from_owm_components([{"pm2_5": 35.5, "o3": 10.0}, None])
+    assert aqi[0] == 101 and dominant[0] == "pm2_5"
+    assert math.isnan(aqi[1])
+
+
+def test_category_lookup_edges():
+    lookup = CategoryLookup({(0, 50): {"label": "Good", "color": "green"}, (51, 100): {"label": "Moderate", "color": "yellow"}})
+    assert list(lookup.labels_for([0, 50, 50.9, 51, 100, 250, -1, np.nan])) == ["Good", "Good", "Good", "Moderate", "Moderate", "Moderate", "Unknown", "Unknown"]
+    assert lookup.category("x") == ("Unknown", "#808080") and lookup.category(None) == ("Unknown", "#808080")
+    assert lookup.category(51) == ("Moderate", "yellow")
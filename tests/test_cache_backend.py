@@ -0,0 +1,106 @@
+import threading
+
+import numpy as np
+import pytest
+
+import cache_backend
+from cache_backend import LRUBackend, RedisBackend, SharedCache, SQLiteBackend, StandInRedisServer, backend_from_url, dumps, loads
+
+
+@pytest.fixture
+def redis_backend():
+    server = StandInRedisServer(("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True); thread.start()
+    yield RedisBackend("127.0.0.1", server.server_address[1])
+    server.shutdown(); server.server_close()
+
+
+@pytest.fixture(params=["lru", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "lru": return LRUBackend()
+    if request.param == "sqlite": return SQLiteBackend(str(tmp_path / "cache.db"))
+    return request.getfixturevalue("redis_backend")
+
+
+@pytest.mark.parametrize("value", [None, {"aqi": 42}, list(range(1000)), np.arange(2000.0)])
+def test_serialization_round_trip(value):
+    blob = dumps(value)
+    assert np.array_equal(loads(blob), value) if isinstance(value, np.ndarray) else loads(blob) == value
+
+
+def test_large_values_are_compressed():
+    assert dumps(list(range(1000)))[:1] == b"Z" and dumps({"aqi": 42})[:1] == b"P"
+
+
+def test_backend_round_trip(backend):
+    assert backend.get("missing") is None
+    backend.set("key", b"\x00binary\r\nvalue", 60)
+    assert backend.get("key") == b"\x00binary\r\nvalue"
+    backend.set("key", b"replaced", 60)
+    assert backend.get("key") == b"replaced"
+    backend.delete("key")
+    assert backend.get("key") is None
+
+
+def test_backend_expiry(backend, monkeypatch):
+    backend.set("key", b"value", 0.001)
+    now = cache_backend.time.time() + 1
+    monkeypatch.setattr(cache_backend.time, "time", lambda: now)
+    assert backend.get("key") is None
+
+
+def test_lru_evicts_least_recently_used():
+    backend = LRUBackend(max_entries=2)
+    backend.set("a", b"1", 60); backend.set("b", b"2", 60); backend.get("a"); backend.set("c", b"3", 60)
+    assert backend.get("b") is None and backend.get("a") == b"1" and backend.get("c") == b"3"
+
+
+def test_backend_from_url(tmp_path):
+    assert isinstance(backend_from_url(None), LRUBackend)
+    assert isinstance(backend_from_url(f"sqlite:///{tmp_path}/cache.db"), SQLiteBackend)
+    redis = backend_from_url("redis://cache.local:6390/2")
+    assert (redis.host, redis.port, redis.db) == ("cache.local", 6390, 2)
+    with pytest.raises(ValueError): backend_from_url("memcached://x")
+
+
+def test_shared_cache_round_trip(backend):
+    cache = SharedCache(backend)
+    assert cache.get("k") is None
+    cache.set("k", {"stations": [1, 2, 3]}, 60)
+    assert cache.get("k") == {"stations": [1, 2, 3]} and cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+
+class FailingBackend:
+    name = "failing"
+    def get(self, key): raise ConnectionError("down")
+    def set(self, key, blob, ttl): raise ConnectionError("down")
+
+
+def test_shared_cache_treats_backend_errors_as_misses():
+    cache = SharedCache(FailingBackend())
+    cache.set("k", 1, 60)
+    assert cache.get("k") is None and cache.stats["errors"] == 1 # The failing backend is bypassed after the first error
+
+
+def test_shared_cache_decorator_stores_only_successes(monkeypatch):
+    monkeypatch.setattr(cache_backend, "_cache", SharedCache(LRUBackend()))
+    calls = []
+
+    @cache_backend.shared_cache(ttl=60)
+    def fetch(city, fail=False):
+        calls.append(city)
+        return (None, "API error") if fail else ({"city": city}, None)
+
+    assert fetch("Dhaka") == ({"city": "Dhaka"}, None) and fetch("Dhaka") == ({"city": "Dhaka"}, None)
+    assert fetch("Delhi", fail=True) == (None, "API error") and fetch("Delhi", fail=True) == (None, "API error")
+    assert calls == ["Dhaka", "Delhi", "Delhi"]
+
+
+@pytest.mark.parametrize("blob", [b"Z" + b"\x78\x9c truncated", b"P\x80\x05 not a pickle", b""])
+def test_shared_cache_drops_unreadable_entries(backend, blob):
+    cache = SharedCache(backend)
+    backend.set(cache_backend.KEY_PREFIX + "k", blob, 60)
+    assert cache.get("k") is None and cache.stats["errors"] == 1 and cache.stats["misses"] == 1
+    assert backend.get(cache_backend.KEY_PREFIX + "k") is None # Deleted, so the next fetch repopulates it
+    cache.set("k", 42, 60)
+    assert cache.get("k") == 42 # One bad entry does not take the backend out of service
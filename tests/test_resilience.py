@@ -0,0 +1,88 @@
+import pytest
+
+import resilience
+from resilience import CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("api", failure_threshold=3, reset_timeout=30)
+    for _ in range(2): assert breaker.allow(); breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.allow(); breaker.record_failure()
+    assert breaker.state == "open" and breaker.stats["opened"] == 1
+    assert not breaker.allow() and breaker.stats["rejected"] == 1
+    assert breaker.retry_in() == 30
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker("api", failure_threshold=2)
+    breaker.record_failure(); breaker.record_success(); breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_admits_one_probe(clock):
+    breaker = CircuitBreaker("api", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 29.9
+    assert not breaker.allow()
+    clock[0] += 0.1
+    assert breaker.allow() and breaker.state == "half-open"
+    assert not breaker.allow() # The probe is still in flight
+    breaker.release()
+    assert breaker.allow() # A probe that was never sent is given back
+
+
+def test_successful_probe_closes(clock):
+    breaker = CircuitBreaker("api", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure(); clock[0] += 30
+    assert breaker.allow(); breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0 and breaker.reset_timeout == 30
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens_with_backoff(clock):
+    breaker = CircuitBreaker("api", failure_threshold=1, reset_timeout=30, max_reset_timeout=100)
+    breaker.record_failure()
+    for expected in (60, 100, 100):
+        clock[0] += breaker.reset_timeout
+        assert breaker.allow(); breaker.record_failure()
+        assert breaker.state == "open" and breaker.reset_timeout == expected
+    clock[0] += 100; assert breaker.allow(); breaker.record_success()
+    assert breaker.reset_timeout == 30 # Back-off resets once the endpoint recovers
+
+
+def test_registry_shares_breakers_by_name():
+    registry = resilience.BreakerRegistry(failure_threshold=5)
+    assert registry.get("a") is registry.get("a") and registry.get("a").failure_threshold == 5
+    assert [b["name"] for b in registry.snapshot()] == ["a"]
+
+
+def test_endpoint_name_drops_per_city_path_parts():
+    assert resilience.endpoint_name("https://api.waqi.info/feed/@1234/") == ("WAQI", "WAQI /feed")
+    assert resilience.endpoint_name("http://api.airvisual.com/v2/city") == ("IQAir", "IQAir /v2/city")
+
+
+def test_last_good_fallback_serves_stored_result_only_on_transport_failures(monkeypatch):
+    monkeypatch.setattr(resilience, "LAST_GOOD", resilience.LastGoodStore())
+    outcome = {"data": {"aqi": 42}, "error": None, "transport": False}
+
+    @resilience.last_good_fallback
+    def fetch(city):
+        if outcome["transport"]: resilience._note_transport_failure("WAQI /feed")
+        return outcome["data"], outcome["error"]
+
+    assert fetch("Dhaka") == ({"aqi": 42}, None)
+    outcome.update(data=None, error="Invalid key") # The provider answered: its error is passed on
+    assert fetch("Dhaka") == (None, "Invalid key")
+    outcome.update(error="Connection error", transport=True)
+    with resilience.track_stale() as stale:
+        assert fetch("Dhaka") == ({"aqi": 42}, None)
+        assert fetch("Delhi") == (None, "Connection error") # Nothing stored for this call
+    assert [(entry["source"], entry["reason"]) for entry in stale] == [("fetch", "Connection error")]
@@ -0,0 +1,73 @@
+import calendar
+import time
+
+import numpy as np
+import pytest
+
+from history import HISTORY_POLLUTANTS, PollutantHistory
+from rollups import METRICS, RollupStore, aggregate, bucket_starts, choose_level
+
+DAY = 86400
+
+
+def utc(*fields): return calendar.timegm((*fields, 0, 0, 0)[:6])
+
+
+def test_day_and_hour_bucket_boundaries():
+    assert list(bucket_starts([0, 3599, 3600, DAY - 1, DAY], "hour")) == [0, 0, 3600, DAY - 3600, DAY]
+    assert list(bucket_starts([DAY - 1, DAY, 2 * DAY - 1], "day")) == [0, DAY, DAY]
+
+
+def test_month_buckets_follow_calendar_months():
+    stamps = [utc(2024, 1, 31, 23, 59, 59), utc(2024, 2, 1), utc(2024, 2, 29, 12), utc(2024, 3, 1), utc(2023, 12, 31, 23)]
+    assert list(bucket_starts(stamps, "month")) == [utc(2024, 1, 1), utc(2024, 2, 1), utc(2024, 2, 1), utc(2024, 3, 1), utc(2023, 12, 1)]
+
+
+def test_aggregate_splits_at_day_boundary_and_ignores_nan():
+    timestamps = np.arange(DAY - 2 * 3600, DAY + 3 * 3600, 3600) # 2 hours before midnight, 3 after
+    values = np.tile(np.arange(len(timestamps), dtype=float)[:, None], (1, len(METRICS)))
+    values[-1, 0] = np.nan
+    buckets, counts, stats = aggregate(timestamps, values, "day")
+    assert list(buckets) == [0, DAY] and list(counts) == [2, 3]
+    assert stats[0, :, 1].tolist() == [0.0, 0.5, 1.0, pytest.approx(0.95)] # min, mean, max, p95
+    assert stats[1, :3, 0].tolist() == [2.0, 2.5, 3.0] and stats[1, 1, 1] == 3.0 # The NaN hour is skipped
+
+
+def test_all_nan_metric_gives_nan_stats():
+    values = np.full((3, len(METRICS)), np.nan)
+    _, counts, stats = aggregate(np.arange(3) * 3600, values, "day")
+    assert counts.tolist() == [3] and np.isnan(stats).all()
+
+
+def test_choose_level():
+    assert choose_level(0, 7 * DAY, 500) == "hour" # 168 hours
+    assert choose_level(0, 30 * DAY, 500) == "day" # 720 hours
+    assert choose_level(0, 3 * 365 * DAY, 500) == "month"
+
+
+def history(start, hours, value=1.0):
+    timestamps = start + np.arange(hours, dtype=np.int64) * 3600
+    return PollutantHistory(timestamps, {key: np.full(hours, value) for key in HISTORY_POLLUTANTS}, np.full(hours, value * 10))
+
+
+def test_store_ingests_new_hours_and_refreshes_touched_buckets(tmp_path):
+    store = RollupStore(str(tmp_path / "cache" / "rollups.db"))
+    assert store.snapshot()["locations"] == 0 and not (tmp_path / "cache").exists() # Nothing is created before the first ingest
+    today = int(time.time()) // DAY * DAY
+    start = today - 2 * DAY
+    assert store.ingest("cell", history(start, 48), label="City") == 48
+    assert store.ingest("cell", history(start, 48)) == 0 # Hours already stored are skipped
+    series = store.query("cell", start, today, level="day")
+    assert series.buckets.tolist() == [start, start + DAY] and series.counts.tolist() == [24, 24]
+    assert store.ingest("cell", history(start + DAY + 12 * 3600, 24, value=3.0)) == 12 # Only the 12 hours after the stored ones are new
+    series = store.query("cell", start, today + DAY, level="day")
+    assert series.counts.tolist() == [24, 24, 12]
+    assert series.column("pm2_5").tolist() == [1.0, 1.0, 3.0] and series.column("aqi", "max").tolist() == [10.0, 10.0, 30.0]
+    assert store.locations() == {"cell": "City"} and store.snapshot()["locations"] == 1
+
+
+def test_store_drops_hours_past_retention(tmp_path):
+    store = RollupStore(str(tmp_path / "rollups.db"), retention_days=1)
+    now = int(time.time()) // 3600 * 3600
+    assert store.ingest("cell", history(now - 3 * DAY, 24)) == 0
+    assert store.ingest("cell", history(now - 12 * 3600, 6)) == 6
@@ -0,0 +1,48 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import QueueTimeout, RequestScheduler, request_priority
+
+
+def test_per_host_limit():
+    scheduler = RequestScheduler(max_concurrent=8, per_host=2)
+    slots = [scheduler.acquire("a.example", "interactive") for _ in range(2)]
+    with pytest.raises(QueueTimeout): scheduler.acquire("a.example", "interactive", timeout=0.05)
+    other = scheduler.acquire("b.example", "interactive", timeout=0.05) # Other hosts are not held up
+    scheduler.release(slots[0])
+    slots[0] = scheduler.acquire("a.example", "interactive", timeout=0.05)
+    for slot in slots + [other]: scheduler.release(slot)
+    assert scheduler.in_flight == 0 and scheduler.stats["interactive"]["timeouts"] == 1
+
+
+def test_waiter_for_busy_host_does_not_block_other_hosts():
+    scheduler = RequestScheduler(max_concurrent=8, per_host=1)
+    held = scheduler.acquire("a.example", "secondary")
+    granted = []
+    waiting = threading.Thread(target=lambda: granted.append(scheduler.acquire("a.example", "secondary", session="s1", timeout=5)))
+    waiting.start()
+    while not scheduler.snapshot()["secondary"]["waiting"]: time.sleep(0.001)
+    other = scheduler.acquire("b.example", "secondary", session="s1", timeout=0.05)
+    assert not granted
+    scheduler.release(held); waiting.join(5)
+    assert granted and granted[0].host == "a.example"
+    scheduler.release(granted[0]); scheduler.release(other)
+
+
+def test_class_share_limits_background():
+    scheduler = RequestScheduler(max_concurrent=4, per_host=4)
+    assert scheduler.class_limits == {"interactive": 4, "secondary": 3, "background": 2}
+    background = [scheduler.acquire(f"h{i}", "background") for i in range(2)]
+    with pytest.raises(QueueTimeout): scheduler.acquire("h2", "background", timeout=0.05)
+    interactive = scheduler.acquire("h2", "interactive", timeout=0.05)
+    for slot in background + [interactive]: scheduler.release(slot)
+
+
+def test_nested_priority_cannot_become_more_urgent():
+    scheduler = RequestScheduler()
+    with request_priority("background"), request_priority("interactive"):
+        slot = scheduler.acquire("a.example")
+    assert slot.priority == "background"
+    scheduler.release(slot)
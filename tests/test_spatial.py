@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from spatial import aggregate_by_nearest, geohash_bounds, geohash_center, geohash_encode, idw, idw_estimate, idw_grid, mercator_latitudes, nearest_stations
+
+
+def test_nearest_stations_distances_are_great_circle():
+    distances, indices = nearest_stations([0.0], [0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 2.0], k=3)
+    assert indices[0].tolist() == [0, 1, 2]
+    assert distances[0].tolist() == pytest.approx([0.0, 111.195, 222.39], abs=0.01)
+
+
+def test_idw_takes_station_value_on_top_of_a_station_and_drops_far_points():
+    stations_lat, stations_lon, values = [0.0, 0.0], [0.0, 1.0], [10.0, 30.0]
+    estimates, nearest_km = idw([0.0, 0.0, 40.0], [0.0, 0.5, 0.0], stations_lat, stations_lon, values, max_distance_km=100)
+    assert estimates[0] == pytest.approx(10.0) and estimates[1] == pytest.approx(20.0) and np.isnan(estimates[2])
+    assert nearest_km[2] > 100
+    empty, _ = idw([0.0], [0.0], [], [], [])
+    assert np.isnan(empty).all()
+
+
+def test_mercator_rows_run_north_to_south_and_clip_the_poles():
+    lats = mercator_latitudes(-90.0, 90.0, 5)
+    assert lats[0] == pytest.approx(85.0) and lats[-1] == pytest.approx(-85.0) and lats[2] == pytest.approx(0.0, abs=1e-9)
+    assert np.all(np.diff(lats) < 0)
+
+
+def test_idw_grid_shape_and_orientation():
+    grid, lats, lons = idw_grid(0.0, 0.0, 10.0, 10.0, [10.0, 0.0], [0.0, 10.0], [100.0, 0.0], width=4, height=3)
+    assert grid.shape == (3, 4) and len(lats) == 3 and len(lons) == 4
+    assert grid[0, 0] == pytest.approx(100.0) and grid[-1, -1] == pytest.approx(0.0) # Row 0 is the northern edge
+
+
+def test_idw_estimate_confidence_falls_with_distance_and_range():
+    stations_lat, stations_lon, values = [0.0, 0.0, 0.1], [0.0, 0.1, 0.0], [50.0, 50.0, 50.0]
+    result = idw_estimate([0.0, 0.0, 5.0], [0.05, 0.3, 0.0], stations_lat, stations_lon, values, max_distance_km=50)
+    assert result["estimate"][:2].tolist() == pytest.approx([50.0, 50.0]) and np.isnan(result["estimate"][2])
+    assert result["stations"].tolist() == [3, 3, 0]
+    assert 1.0 >= result["confidence"][0] > result["confidence"][1] > 0 and result["confidence"][2] == 0.0
+
+
+def test_idw_estimate_confidence_drops_when_stations_disagree():
+    agree = idw_estimate([0.0], [0.05], [0.0, 0.0], [0.0, 0.1], [50.0, 50.0])
+    disagree = idw_estimate([0.0], [0.05], [0.0, 0.0], [0.0, 0.1], [0.0, 100.0])
+    assert disagree["estimate"][0] == pytest.approx(50.0) and disagree["confidence"][0] < agree["confidence"][0]
+
+
+def test_geohash_known_value_and_bounds():
+    assert geohash_encode(57.64911, 10.40744, precision=11) == "u4pruydqqvj"
+    south, west, north, east = geohash_bounds("u4pruydqqvj")
+    assert south <= 57.64911 <= north and west <= 10.40744 <= east
+    lat, lon = geohash_center("u4pru")
+    assert geohash_encode(lat, lon) == "u4pru"
+
+
+def test_geohash_cell_edges_belong_to_the_north_east_cell():
+    south, west, north, east = geohash_bounds("u4pru")
+    assert geohash_encode(south, west) == "u4pru" and geohash_encode(north, east) != "u4pru"
+
+
+def test_aggregate_by_nearest_counts_max_and_median_per_centre():
+    points_lat = [0.0, 0.01, 0.02, 0.03, 10.0, 5.0]; points_lon = [0.0] * 5 + [5.0]
+    result = aggregate_by_nearest(points_lat, points_lon, [1.0, 4.0, 2.0, np.nan, 7.0, 99.0], [0.0, 10.0, 20.0], [0.0, 0.0, 0.0])
+    assert result["count"].tolist() == [3, 1, 0] # NaN values and points beyond max_distance_km are dropped
+    assert result["max"][:2].tolist() == [4.0, 7.0] and result["median"][:2].tolist() == [2.0, 7.0]
+    assert np.isnan(result["max"][2]) and np.isnan(result["median"][2])
+
+
+def test_aggregate_by_nearest_even_count_median_and_empty_inputs():
+    result = aggregate_by_nearest([0.0] * 4, [0.0] * 4, [1.0, 2.0, 3.0, 10.0], [0.0], [0.0])
+    assert result["median"].tolist() == [2.5] and result["max"].tolist() == [10.0]
+    empty = aggregate_by_nearest([], [], [], [0.0, 1.0], [0.0, 1.0])
+    assert empty["count"].tolist() == [0, 0] and np.isnan(empty["median"]).all()
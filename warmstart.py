@@ -0,0 +1,154 @@
+"""Warm-start snapshots: hot fetch results persisted to disk and reused after a restart.
+
+Functions wrapped with @warm_start(max_age) remember their last successful result per
+call. A background thread writes them to one snapshot file every SNAPSHOT_INTERVAL
+seconds (and at exit), in the shared cache's compact format (pickle + zlib).
+
+After a restart the file is read on first use. A call whose result is in the snapshot
+and younger than max_age returns it at once and revalidates it in the background;
+once a fresh result arrives the call goes through the wrapped function as usual.
+
+The file is AIR13X_SNAPSHOT (default air13x-snapshot.bin); set it to "" to disable.
+"""
+import atexit
+import concurrent.futures
+import functools
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from cache_backend import call_key, dumps, loads
+from change_detection import STATS as CHANGE_STATS
+from scheduler import request_priority
+
+
+SNAPSHOT_PATH = os.environ.get("AIR13X_SNAPSHOT", "air13x-snapshot.bin")
+SNAPSHOT_INTERVAL = 300 # Seconds between snapshot writes (only when something changed)
+SNAPSHOT_MAX_ENTRIES = 2048
+SNAPSHOT_MAGIC = b"AIR13XW2" # Bump with cache_backend.KEY_PREFIX when cached value shapes change
+REVALIDATE_WORKERS = 2
+
+logger = logging.getLogger("air13x.warmstart")
+
+
+def _same(stored, data):
+    try: return stored is data or bool(stored == data)
+    except Exception: return False # e.g. ambiguous array comparisons: treat as changed
+
+
+class SnapshotStore:
+    """Last successful result per call key, loaded lazily from and saved atomically to one file."""
+
+    def __init__(self, path, max_entries=SNAPSHOT_MAX_ENTRIES, interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.max_entries = max_entries
+        self.interval = interval
+        self._entries = OrderedDict() # key -> (stored_at, data)
+        self._cold = set() # Keys loaded from disk and not revalidated yet
+        self._revalidating = set()
+        self._loaded = False; self._dirty = False; self._saver = None
+        self._lock = threading.RLock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=REVALIDATE_WORKERS, thread_name_prefix="air13x-warm")
+        self.stats = {"loaded": 0, "served": 0, "revalidated": 0, "revalidate_failed": 0, "saves": 0, "bytes": 0, "load_ms": 0.0}
+
+    def _load(self):
+        """Reads the snapshot file once, on first use. A missing or unreadable file just means a cold start."""
+        self._loaded = True
+        if not os.path.exists(self.path): return
+        started = time.perf_counter()
+        try:
+            with open(self.path, "rb") as handle: blob = handle.read()
+            if not blob.startswith(SNAPSHOT_MAGIC): raise ValueError("not an Air 13X snapshot (or an older format)")
+            entries = loads(blob[len(SNAPSHOT_MAGIC):])
+        except Exception as exc: logger.warning("Ignoring warm-start snapshot %s - %s", self.path, exc); return
+        self._entries.update(entries); self._cold.update(entries)
+        self.stats.update(loaded=len(entries), bytes=len(blob), load_ms=(time.perf_counter() - started) * 1000)
+
+    def lookup(self, key, max_age):
+        """The snapshot result for a key that has not been revalidated since startup, or None."""
+        with self._lock:
+            if not self._loaded: self._load()
+            if key not in self._cold: return None
+            stored_at, data = self._entries[key]
+            if time.time() - stored_at > max_age: self._cold.discard(key); return None # Too old to show
+            self.stats["served"] += 1
+            return data
+
+    def record(self, key, data):
+        """Stores a fresh result. A result equal to the stored one only refreshes its time, without a snapshot write for it."""
+        with self._lock:
+            if not self._loaded: self._load()
+            previous = self._entries.get(key)
+            self._entries[key] = (time.time(), data); self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries: self._cold.discard(self._entries.popitem(last=False)[0])
+            self._cold.discard(key)
+            if previous is not None and _same(previous[1], data): CHANGE_STATS["snapshot_writes_skipped"] += 1
+            else: self._dirty = True
+            if self._saver is None and self.interval:
+                self._saver = threading.Thread(target=self._save_periodically, name="air13x-snapshot", daemon=True); self._saver.start()
+
+    def revalidate(self, key, func, args, kwargs):
+        """Refetches a snapshot result in the background; at most one refetch per key at a time."""
+        with self._lock:
+            if key in self._revalidating: return
+            self._revalidating.add(key)
+        self._executor.submit(self._revalidate, key, func, args, kwargs)
+
+    def _revalidate(self, key, func, args, kwargs):
+        try:
+            with request_priority("background"): data, error = func(*args, **kwargs)
+        except Exception as exc: data, error = None, str(exc)
+        finally:
+            with self._lock: self._revalidating.discard(key)
+        if error is None and data is not None: self.record(key, data); self.stats["revalidated"] += 1
+        else: self.stats["revalidate_failed"] += 1 # Keep serving the snapshot; the next call retries
+
+    def save(self):
+        """Writes the snapshot if anything changed since the last write (temp file + rename, so readers never see a partial file)."""
+        with self._lock:
+            if not self._dirty: return False
+            entries = dict(self._entries); self._dirty = False
+        blob = SNAPSHOT_MAGIC + dumps(entries)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=directory, prefix=".snapshot-", delete=False) as handle: handle.write(blob)
+            os.replace(handle.name, self.path)
+        except OSError as exc:
+            logger.warning("Could not write warm-start snapshot %s - %s", self.path, exc)
+            with self._lock: self._dirty = True
+            return False
+        self.stats["saves"] += 1; self.stats["bytes"] = len(blob)
+        return True
+
+    def _save_periodically(self):
+        while True:
+            time.sleep(self.interval); self.save()
+
+    def snapshot(self):
+        with self._lock: return {"path": self.path, "entries": len(self._entries), "cold": len(self._cold), **self.stats}
+
+
+SNAPSHOTS = SnapshotStore(SNAPSHOT_PATH) if SNAPSHOT_PATH else None
+if SNAPSHOTS: atexit.register(SNAPSHOTS.save)
+
+
+def warm_start(max_age):
+    """Persists a (data, error) fetch's good results across restarts; snapshot results older than max_age seconds are not served."""
+    def decorator(func):
+        if SNAPSHOTS is None: return func
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = call_key(func, args, kwargs)
+            data = SNAPSHOTS.lookup(key, max_age)
+            if data is not None:
+                SNAPSHOTS.revalidate(key, func, args, kwargs)
+                return data, None
+            data, error = func(*args, **kwargs)
+            if error is None and data is not None: SNAPSHOTS.record(key, data)
+            return data, error
+        return wrapper
+    return decorator